@@ -0,0 +1,757 @@
+# benchmark.py
+
+# imports
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import struct
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from time import perf_counter
+from timeit import timeit
+from sqlalchemy import create_engine, select, insert, text, func, update
+from sqlalchemy.engine import Engine
+from control_protocol import PacketBuilder, PacketView
+from db_writer import BatchWriter
+from decision import decide
+from graph_dev import post_plot, read_history
+from house_registry import HouseRegistry
+from house_state import HouseStateRegistry
+from ingest_server import TelemetryProtocol, make_socket, serve
+from initdb import migrate
+from param_oracle import ParamOracle
+from rolling_stats import RollingStats
+from models import ActionPool, HousePool, HDData, HDRollup1m, HDRollup1h
+from state_store import LatestStateStore, latest_query
+from telemetry import decode_batch, decode_telemetry
+
+def make_datagrams(count: int) -> list[tuple[bytes, tuple[str, int]]]:
+    """Makes random telemetry datagrams from a handful of senders.
+
+    Args:
+        count (int): number of datagrams
+
+    Returns:
+        list[tuple[bytes, tuple[str, int]]]: (payload, sender) pairs
+    """
+
+    datagrams = []
+    for i in range(count):
+        payload: bytes = bytes([random.randint(0, 1)]) \
+                + struct.pack(">f", random.uniform(0, 3)) \
+                + struct.pack(">f", random.uniform(15, 25)) \
+                + (1682092177 + i).to_bytes(4, 'big')
+        datagrams.append((payload, (f"10.10.0.{101 + i % 100}", 42070)))
+    return datagrams
+
+def decode_per_field(datagrams: list[tuple[bytes, tuple[str, int]]]) -> list:
+    """The original RecvUnpack decode, one slice and unpack per field.
+
+    Args:
+        datagrams (list[tuple[bytes, tuple[str, int]]]): (payload, sender) pairs
+
+    Returns:
+        list: decoded (record, sender) pairs
+    """
+
+    records = []
+    for data, addr in datagrams:
+        device_state: int = data[0]
+        power_usage: float = struct.unpack(">f", data[1:5])[0]
+        temperature: float = struct.unpack(">f", data[5:9])[0]
+        unix_timestamp: int = int.from_bytes(data[9:13], 'big')
+        records.append(((device_state, power_usage, temperature, unix_timestamp), addr))
+    return records
+
+def bench_decode(batch: int = 1000, rounds: int = 200) -> dict:
+    """Compares the per-field, per-datagram and batch telemetry decoders.
+
+    Args:
+        batch (int): datagrams per batch
+        rounds (int): batches to decode per decoder
+
+    Returns:
+        dict: datagrams per second per decoder
+    """
+
+    datagrams = make_datagrams(batch)
+
+    # all decoders must agree before timing them
+    assert decode_batch(datagrams)[0] == [
+            (decode_telemetry(data), addr) for data, addr in datagrams
+            ]
+
+    results: dict[str, float] = {
+            'per field': timeit(lambda: decode_per_field(datagrams), number = rounds),
+            'per datagram': timeit(
+                lambda: [(decode_telemetry(data), addr) for data, addr in datagrams],
+                number = rounds
+                ),
+            'batch': timeit(lambda: decode_batch(datagrams), number = rounds)
+            }
+
+    print(f"Telemetry decode, {batch} datagrams per batch")
+    rates: dict[str, float] = {}
+    for name, seconds in results.items():
+        rates[name] = batch * rounds / seconds
+        print(f"{name:>14}: {seconds / rounds * 1e6:9.1f} us/batch {rates[name]:12.0f} datagrams/s")
+
+    return {'batch': batch, 'datagrams_per_s': rates}
+
+def build_recompile(clk: int, params: list[tuple[int, int]], devices: int) -> bytes:
+    """The original ControlPacket build, every add parses and rebuilds the packet.
+
+    Args:
+        clk (int): clock time
+        params (list[tuple[int, int]]): (id, value) of the int parameters
+        devices (int): devices to switch on
+
+    Returns:
+        bytes: packet
+    """
+
+    packet: bytes = b''
+    flags: int = 0
+
+    def rebuild(new_flags: int, param: bytes = b'') -> bytes:
+        # decompile the current packet
+        cursor: int = 4 if flags & 1 else 0
+        paramlist: list[bytes] = []
+        if flags & 2:
+            cursor += 1
+            for _ in range(packet[cursor - 1]):
+                size: int = packet[cursor + 1]
+                paramlist.append(packet[cursor:cursor + 2 + size])
+                cursor += 2 + size
+
+        # recompile it with the new parameter
+        if param:
+            paramlist = [p for p in paramlist if p[0] != param[0]] + [param]
+        rebuilt: bytes = b''
+        if new_flags & 1:
+            rebuilt += clk.to_bytes(4, 'big')
+        if new_flags & 2:
+            rebuilt += len(paramlist).to_bytes(1, 'big')
+            for p in sorted(paramlist, key = lambda p: p[0]):
+                rebuilt += p
+        if new_flags & 8:
+            rebuilt += devices.to_bytes(1, 'big')
+        return rebuilt
+
+    packet = rebuild(flags | 1)
+    flags |= 1
+    for param_id, value in params:
+        size: int = max((value.bit_length() + 7) // 8, 1)
+        packet = rebuild(flags | 2, param_id.to_bytes(1, 'big') + size.to_bytes(1, 'big') + value.to_bytes(size, 'big'))
+        flags |= 2
+    packet = rebuild(flags | 12)
+    flags |= 12
+    return flags.to_bytes(1, 'big') + packet
+
+def build_single_pass(oracle: ParamOracle, clk: int, params: list[tuple[int, int]], devices: int) -> bytes:
+    """Builds the same packet with the PacketBuilder.
+
+    Args:
+        oracle (ParamOracle): parameter oracle with every id in params
+        clk (int): clock time
+        params (list[tuple[int, int]]): (id, value) of the int parameters
+        devices (int): devices to switch on
+
+    Returns:
+        bytes: packet
+    """
+
+    builder = PacketBuilder(oracle)
+    builder.add_clksync(clk)
+    for param_id, value in params:
+        builder.add_parameter(param_id, value)
+    builder.add_devices(True, devices)
+    return builder.build()
+
+def bench_packet(counts: list[int] = [1, 4, 16, 64, 255], rounds: int = 200) -> dict:
+    """Compares building control packets by recompiling and in a single pass.
+
+    Args:
+        counts (list[int]): parameters per packet
+        rounds (int): packets to build per measurement
+
+    Returns:
+        dict: microseconds per packet by parameter count
+
+    Raises:
+        ValueError: a count above 255, the parameter count is one byte
+    """
+
+    # ids are one byte and the parameter count too
+    if max(counts) > 255:
+        raise ValueError("A packet holds at most 255 parameters")
+    oracle = ParamOracle(None)
+    oracle.index({f"param{i}": {'id': i, 'type': 'int'} for i in range(1, 256)})
+
+    print("Control packet build")
+    print(f"{'params':>8} {'recompile':>14} {'single pass':>14}")
+
+    timings: dict[int, dict[str, float]] = {}
+    for count in counts:
+        params: list[tuple[int, int]] = [
+                (param_id, random.randint(0, 2 ** 32))
+                for param_id in random.sample(range(1, 256), count)
+                ]
+        clk: int = 1682092177
+
+        # both builders must agree before timing them
+        assert build_recompile(clk, params, 1) == build_single_pass(oracle, clk, params, 1)
+
+        recompile: float = timeit(lambda: build_recompile(clk, params, 1), number = rounds)
+        single: float = timeit(lambda: build_single_pass(oracle, clk, params, 1), number = rounds)
+        print(f"{count:>8} {recompile / rounds * 1e6:>11.1f} us {single / rounds * 1e6:>11.1f} us")
+        timings[count] = {'recompile': recompile / rounds * 1e6, 'single pass': single / rounds * 1e6}
+
+    return {'us_per_packet': timings}
+
+def sample_packet(oracle: ParamOracle, params: int) -> bytes:
+    """Builds a control packet with a clock, random parameters and devices.
+
+    Args:
+        oracle (ParamOracle): oracle with int, float and bool parameters for ids 1 to 255
+        params (int): number of parameters
+
+    Returns:
+        bytes: packet
+    """
+
+    builder = PacketBuilder(oracle)
+    builder.add_clksync(random.randint(0, 2 ** 32 - 1))
+    for param_id in random.sample(range(1, 256), params):
+        ptype: str = oracle.lookup(param_id)[2]
+        if ptype == 'float':
+            builder.add_parameter(param_id, random.uniform(-1e6, 1e6))
+        elif ptype == 'bool':
+            builder.add_parameter(param_id, random.random() < 0.5)
+        else:
+            builder.add_parameter(param_id, random.randint(0, 2 ** 32))
+    builder.add_devices(True, 1)
+    return builder.build()
+
+def decompile_copy(data: bytes) -> tuple:
+    """The original ControlPacket._decompile, copying every field.
+
+    Args:
+        data (bytes): serialized packet
+
+    Returns:
+        tuple: clock, parameter list and devices as bytes
+    """
+
+    flags: int = data[0]
+    cursor: int = 1
+    clk = devices = paramlist = None
+    if flags & 1:
+        clk = data[cursor:cursor+4]
+        cursor += 4
+    if flags & 2:
+        paramlist = []
+        cursor += 1
+        for _ in range(data[cursor - 1]):
+            paramsize: int = data[cursor+1]
+            paramlist.append(data[cursor].to_bytes(1, 'big') + paramsize.to_bytes(1, 'big')
+                             + data[cursor+2:cursor+2+paramsize])
+            cursor += 2 + paramsize
+    if flags & 8:
+        devices = data[cursor].to_bytes(1, 'big')
+    return clk, paramlist, devices
+
+def bench_parse(counts: list[int] = [1, 16, 255], rounds: int = 20000) -> dict:
+    """Measures control packet parse throughput, copying against the view.
+
+    The clock and device packets are the ones the controller sends, the
+    others carry a clock, the given number of parameters and devices.
+    The round trip checks are in test_control_protocol.py.
+
+    Args:
+        counts (list[int]): parameters per packet
+        rounds (int): packets to parse per measurement
+
+    Returns:
+        dict: packets per second by packet
+    """
+
+    oracle = ParamOracle(None)
+    oracle.index({
+        f"param{i}": {'id': i, 'type': ('int', 'float', 'bool')[i % 3]}
+        for i in range(1, 256)
+        })
+
+    clock = PacketBuilder(oracle)
+    clock.add_clksync(1682092177)
+    devices = PacketBuilder(oracle)
+    devices.add_devices(True, 1)
+    packets: dict[str, bytes] = {'clock': clock.build(), 'devices': devices.build()}
+    for count in counts:
+        packets[f"{count} params"] = sample_packet(oracle, count)
+
+    def parse_view(data: bytes) -> None:
+        for _ in PacketView(data).params():
+            pass
+
+    print(f"{'packet':>10} {'copying':>16} {'view':>16}")
+    rates: dict[str, dict[str, float]] = {}
+    for name, data in packets.items():
+        number: int = max(rounds // max(len(data) // 64, 1), 200)
+        results: list[float] = [
+                number / min(timeit(lambda: decompile_copy(data), number = number) for _ in range(3)),
+                number / min(timeit(lambda: parse_view(data), number = number) for _ in range(3))
+                ]
+        print(f"{name:>10} " + " ".join(f"{rate:>10.0f} pkt/s" for rate in results))
+        rates[name] = {'copying': results[0], 'view': results[1]}
+
+    return {'packets_per_s': rates}
+
+def fill_hd_data(db_engine: Engine, houses: int, start: int, stop: int) -> None:
+    """Fills hd_data with one sample per house per timestamp.
+
+    Args:
+        db_engine (Engine): Engine to write to
+        houses (int): number of houses
+        start (int): first row number
+        stop (int): row number to stop before
+
+    Returns:
+        None:
+    """
+
+    if db_engine.dialect.name == 'postgresql':
+        # generate the rows server side, inserting millions from python is too slow
+        with db_engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO hd_data (device_state, power_usage, temperature, timestamp, house_id) "
+                "SELECT n % 2, random() * 3, 15 + random() * 10, n / :houses, n % :houses + 1 "
+                "FROM generate_series(:start, :stop - 1) AS n"
+                ), {'houses': houses, 'start': start, 'stop': stop})
+        return
+
+    chunk: int = 100000
+    for offset in range(start, stop, chunk):
+        rows = [{
+            'device_state': n % 2,
+            'power_usage': random.uniform(0, 3),
+            'temperature': random.uniform(15, 25),
+            'timestamp': n // houses,
+            'house_id': n % houses + 1
+            } for n in range(offset, min(offset + chunk, stop))]
+        with db_engine.begin() as conn:
+            conn.execute(insert(HDData), rows)
+
+def latest_per_house_loop(db_engine: Engine) -> list:
+    """The original get_data_from_houses, one query per house.
+
+    Args:
+        db_engine (Engine): Engine to read from
+
+    Returns:
+        list: latest row per house
+    """
+
+    with db_engine.connect() as conn:
+        house_ids = conn.execute(select(HousePool.id)).scalars().all()
+        return [conn.execute(
+            select(HDData).where(HDData.house_id == house_id)
+            .order_by(HDData.timestamp.desc()).limit(1)
+            ).first() for house_id in house_ids]
+
+def latest_per_house_query(db_engine: Engine) -> list:
+    """The single latest-per-house query used to warm the state store.
+
+    Args:
+        db_engine (Engine): Engine to read from
+
+    Returns:
+        list: latest row per house
+    """
+
+    with db_engine.connect() as conn:
+        return conn.execute(latest_query(db_engine.dialect.name)).all()
+
+def house_ip(index: int) -> str:
+    """Ip of the benchmark house with the given index.
+
+    Args:
+        index (int): zero based house index
+
+    Returns:
+        str: ip
+    """
+
+    return f"10.{index // 65536}.{index // 256 % 256}.{index % 256}"
+
+def prepare_db(db_url: str, houses: int) -> Engine:
+    """Migrates a database and replaces its houses and data with test houses.
+
+    Args:
+        db_url (str): database to prepare, its tables are overwritten
+        houses (int): number of houses
+
+    Returns:
+        Engine: engine of the database
+    """
+
+    db_engine: Engine = create_engine(db_url)
+    migrate(db_engine)
+
+    with db_engine.begin() as conn:
+        for table in (HDData, HDRollup1m, HDRollup1h, ActionPool):
+            conn.execute(table.__table__.delete())
+        conn.execute(HousePool.__table__.delete())
+        conn.execute(insert(HousePool), [
+            {'id': i + 1, 'name': f"House {i + 1}", 'ip': house_ip(i)}
+            for i in range(houses)
+            ])
+
+    return db_engine
+
+def bench_latest(db_url: str, houses: int, sizes: list[int], rounds: int = 5) -> dict:
+    """Measures the latest-per-house lookup while hd_data grows.
+
+    Args:
+        db_url (str): database to run against, it is filled with test data
+        houses (int): number of houses
+        sizes (list[int]): hd_data row counts to measure at
+        rounds (int): lookups per measurement, the best one is reported
+
+    Returns:
+        dict: milliseconds per lookup by row count
+    """
+
+    db_engine: Engine = prepare_db(db_url, houses)
+
+    print(f"Latest sample per house, {houses} houses ({db_engine.dialect.name})")
+    print(f"{'rows':>12} {'single query':>14} {'query per house':>16}")
+
+    results: dict[int, dict[str, float]] = {}
+    filled: int = 0
+    for size in sorted(sizes):
+        fill_hd_data(db_engine, houses, filled, size)
+        filled = size
+        if db_engine.dialect.name == 'postgresql':
+            with db_engine.begin() as conn:
+                conn.execute(text("ANALYZE hd_data"))
+
+        timings: dict[str, float] = {}
+        for name, lookup in (('query', latest_per_house_query), ('loop', latest_per_house_loop)):
+            best: float = float('inf')
+            for _ in range(rounds):
+                start: float = perf_counter()
+                lookup(db_engine)
+                best = min(best, perf_counter() - start)
+            timings[name] = best
+
+        print(f"{size:>12} {timings['query'] * 1000:>11.2f} ms {timings['loop'] * 1000:>13.2f} ms")
+        results[size] = {name: seconds * 1000 for name, seconds in timings.items()}
+
+    return {'dialect': db_engine.dialect.name, 'houses': houses, 'ms': results}
+
+def bench_ingest(db_url: str, houses: int, samples: int = 100000) -> dict:
+    """Measures ingest to the database, from datagrams to committed rows.
+
+    Datagrams are decoded in batches, their sender looked up in the house
+    registry and the samples submitted to the batch writer. The clock
+    stops when the writer has flushed everything.
+
+    Args:
+        db_url (str): database to run against, it is filled with test data
+        houses (int): number of houses
+        samples (int): number of datagrams
+
+    Returns:
+        dict: rows per second and the writer statistics
+    """
+
+    db_engine: Engine = prepare_db(db_url, houses)
+    house_registry = HouseRegistry(db_engine = db_engine)
+    house_registry.load()
+
+    datagrams = [(data, (house_ip(i % houses), 42070)) for i, (data, _) in enumerate(make_datagrams(samples))]
+
+    print(f"Ingest to database, {samples} datagrams from {houses} houses ({db_engine.dialect.name})")
+
+    start: float = perf_counter()
+    writer = BatchWriter(db_engine = db_engine, queue_size = samples)
+    writer.start()
+    for offset in range(0, samples, 1000):
+        records, _ = decode_batch(datagrams[offset:offset+1000])
+        for record, addr in records:
+            house_id = house_registry.lookup(addr[0])
+            if house_id != None:
+                writer.submit((*record, house_id))
+    writer.close()
+    seconds: float = perf_counter() - start
+
+    with db_engine.connect() as conn:
+        rows: int = conn.execute(select(func.count()).select_from(HDData)).scalar()
+    assert rows == samples, f"{rows} of {samples} rows written"
+
+    print(f"{rows} rows in {seconds:.2f} s, {rows / seconds:.0f} rows/s")
+    return {'dialect': db_engine.dialect.name, 'rows': rows, 'rows_per_s': rows / seconds,
+            'writer': writer.stats()}
+
+def bench_receive(db_url: str, samples: int = 100000) -> dict:
+    """Measures the batches the ingest server reads from a flooded socket.
+
+    A thread sends the datagrams to the server on loopback as fast as it
+    can while the event loop drains the socket, decodes and persists.
+
+    Args:
+        db_url (str): database to run against, it is filled with test data
+        samples (int): number of datagrams
+
+    Returns:
+        dict: datagrams received and the batch sizes
+    """
+
+    db_engine: Engine = prepare_db(db_url, 1)
+    with db_engine.begin() as conn:
+        conn.execute(update(HousePool).values(ip = '127.0.0.1'))
+    house_registry = HouseRegistry(db_engine = db_engine)
+    house_registry.load()
+
+    writer = BatchWriter(db_engine = db_engine, queue_size = samples)
+    writer.start()
+    protocol = TelemetryProtocol(writer, house_registry)
+    payloads: list[bytes] = [data for data, _ in make_datagrams(samples)]
+
+    async def flood() -> float:
+        sock: socket.socket = make_socket(port = 0)
+        address: tuple[str, int] = ('127.0.0.1', sock.getsockname()[1])
+        server = asyncio.create_task(serve(protocol, sock))
+
+        def send() -> None:
+            sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            for payload in payloads:
+                sender.sendto(payload, address)
+            sender.close()
+
+        start: float = perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, send)
+
+        # until nothing arrived for a while
+        received: int = -1
+        while received != protocol.received:
+            received = protocol.received
+            await asyncio.sleep(0.2)
+        server.cancel()
+        return perf_counter() - start - 0.2
+
+    seconds: float = asyncio.run(flood())
+    writer.close()
+
+    batch: float = protocol.received / max(protocol.batches, 1)
+    print(f"Socket drain, {samples} datagrams on loopback")
+    print(f"{protocol.received} received in {protocol.batches} batches, "
+          f"{batch:.1f} datagrams per batch, {protocol.received / seconds:.0f} datagrams/s")
+
+    return {'sent': samples, 'stats': protocol.stats(), 'datagrams_per_batch': batch,
+            'datagrams_per_s': protocol.received / seconds}
+
+def random_fleet(houses: int) -> list[tuple[int, float, float, int, int]]:
+    """Makes one random latest sample per house.
+
+    Args:
+        houses (int): number of houses
+
+    Returns:
+        list[tuple[int, float, float, int, int]]: samples, house ids from 1
+    """
+
+    return [(random.randint(0, 1), random.uniform(0, 3), random.uniform(15, 25), 1682092177, i + 1)
+            for i in range(houses)]
+
+def bench_snapshot(fleets: list[int], rounds: int = 20) -> dict:
+    """Measures get_data_from_houses, a snapshot of the latest-state store.
+
+    Args:
+        fleets (list[int]): fleet sizes
+        rounds (int): snapshots per measurement, the best one is reported
+
+    Returns:
+        dict: milliseconds per snapshot by fleet size
+    """
+
+    print("Latest-state snapshot (get_data_from_houses)")
+    print(f"{'houses':>8} {'snapshot':>12}")
+
+    results: dict[int, float] = {}
+    for houses in fleets:
+        state_store = LatestStateStore()
+        state_store.update_many(random_fleet(houses))
+        best: float = min(timeit(state_store.snapshot, number = 1) for _ in range(rounds))
+        results[houses] = best * 1000
+        print(f"{houses:>8} {best * 1000:>9.3f} ms")
+
+    return {'ms': results}
+
+def bench_decision(fleets: list[int], rounds: int = 20) -> dict:
+    """Measures one decision over the fleet, above, below and inside the band.
+
+    The band is scaled with the fleet so a decision switches a tenth of
+    the houses. A third of the houses start switched off.
+
+    Args:
+        fleets (list[int]): fleet sizes
+        rounds (int): decisions per measurement, the best one is reported
+
+    Returns:
+        dict: milliseconds per decision by fleet size and case
+    """
+
+    print("Decision loop, house state update and decision")
+    print(f"{'houses':>8} {'above':>12} {'below':>12} {'inside':>12}")
+
+    results: dict[int, dict[str, float]] = {}
+    for houses in fleets:
+        fleet = random_fleet(houses)
+        total: float = sum(sample[1] for sample in fleet)
+        states = HouseStateRegistry()
+        for sample in fleet[:houses // 3]:
+            states.set_state(sample[4], False)
+
+        bands: dict[str, tuple[float, float]] = {
+                'above': (total * 0.8, total * 0.9),
+                'below': (total * 1.1, total * 1.2),
+                'inside': (total * 0.95, total * 1.05)
+                }
+
+        results[houses] = {}
+        for case, (min_usage, max_usage) in bands.items():
+            def decision() -> None:
+                states.observe(fleet)
+                decide(fleet, states, min_usage, max_usage, 1.5)
+            best: float = min(timeit(decision, number = 1) for _ in range(rounds))
+            results[houses][case] = best * 1000
+
+        print(f"{houses:>8} " + " ".join(f"{ms:>9.3f} ms" for ms in results[houses].values()))
+
+    return {'ms': results}
+
+def bench_plot(db_url: str, houses: int, rows: int, points: int = 1920) -> dict:
+    """Measures the history plot, summed in SQL, streamed and downsampled.
+
+    Args:
+        db_url (str): database to run against, it is filled with test data
+        houses (int): number of houses
+        rows (int): hd_data rows
+        points (int): points the series is downsampled to
+
+    Returns:
+        dict: seconds per stage and the peak memory of the read
+    """
+
+    db_engine: Engine = prepare_db(db_url, houses)
+    fill_hd_data(db_engine, houses, 0, rows)
+
+    print(f"History plot, {rows} rows of {houses} houses ({db_engine.dialect.name})")
+
+    timings: dict[str, float] = {}
+    tracemalloc.start()
+    start: float = perf_counter()
+    timestamps, _ = read_history(points, db_engine)
+    timings['read'] = perf_counter() - start
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # the image is only timed, not kept
+    with tempfile.TemporaryDirectory() as tmp:
+        start = perf_counter()
+        post_plot(os.path.join(tmp, 'bench_graph.png'), points = points, db_engine = db_engine)
+        timings['plot'] = perf_counter() - start
+
+    print(f"{rows // houses} timestamps to {len(timestamps)} points, read and downsample "
+          f"{timings['read']:.3f} s with a {peak / 1e6:.1f} MB peak, whole plot {timings['plot']:.3f} s")
+
+    return {'dialect': db_engine.dialect.name, 'points': len(timestamps), 'seconds': timings,
+            'peak_bytes': peak}
+
+def bench_rolling(fleets: list[int], rounds: int = 5) -> dict:
+    """Measures the rolling statistics update and the smoothed fleet state.
+
+    Args:
+        fleets (list[int]): fleet sizes
+        rounds (int): samples per house, and smoothings per measurement
+
+    Returns:
+        dict: microseconds per sample and milliseconds per smoothing by fleet size
+    """
+
+    print("Rolling statistics, update per sample and smoothing of the fleet")
+    print(f"{'houses':>8} {'update':>12} {'smoothed':>12}")
+
+    results: dict[int, dict[str, float]] = {}
+    for houses in fleets:
+        fleet = random_fleet(houses)
+        stats = RollingStats()
+
+        start: float = perf_counter()
+        for step in range(rounds):
+            stats.update_many((sample[0], sample[1], sample[2], sample[3] + step, sample[4]) for sample in fleet)
+        update: float = (perf_counter() - start) / (rounds * houses)
+
+        best: float = min(timeit(lambda: stats.smoothed(fleet), number = 1) for _ in range(rounds))
+        results[houses] = {'update_us': update * 1e6, 'smoothed_ms': best * 1000}
+        print(f"{houses:>8} {update * 1e6:>9.3f} us {best * 1000:>9.3f} ms")
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Area controller benchmarks")
+    parser.add_argument('benchmark', nargs = '+',
+                        choices = ['all', 'decode', 'receive', 'packet', 'parse', 'ingest', 'latest', 'snapshot', 'decision', 'plot', 'rolling'])
+    parser.add_argument('--db', default = 'sqlite:///bench.db',
+                        help = "database url for the ingest and latest benchmarks, "
+                        "its tables are overwritten, use a throwaway database")
+    parser.add_argument('--houses', type = int, default = 300)
+    parser.add_argument('--rows', type = int, nargs = '+',
+                        default = [10000, 100000, 1000000])
+    parser.add_argument('--samples', type = int, default = 100000,
+                        help = "datagrams for the ingest and receive benchmarks")
+    parser.add_argument('--fleets', type = int, nargs = '+',
+                        default = [100, 1000, 10000, 100000])
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = "write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmarks = {
+            'decode': lambda: bench_decode(),
+            'receive': lambda: bench_receive(args.db, args.samples),
+            'packet': lambda: bench_packet(),
+            'parse': lambda: bench_parse(),
+            'ingest': lambda: bench_ingest(args.db, args.houses, args.samples),
+            'latest': lambda: bench_latest(args.db, args.houses, args.rows),
+            'snapshot': lambda: bench_snapshot(args.fleets),
+            'decision': lambda: bench_decision(args.fleets),
+            'plot': lambda: bench_plot(args.db, args.houses, max(args.rows)),
+            'rolling': lambda: bench_rolling(args.fleets)
+            }
+
+    selected: list[str] = list(benchmarks) if 'all' in args.benchmark else args.benchmark
+    random.seed(args.seed)
+
+    results: dict = {}
+    for name in selected:
+        results[name] = benchmarks[name]()
+        print()
+
+    if args.output:
+        report: dict = {
+                'time': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'args': vars(args),
+                'results': results
+                }
+        with open(args.output, 'w') as fd:
+            json.dump(report, fd, indent = '\t')
+        print(f"Results written to {args.output}")
@@ -1,50 +1,61 @@
 # clk_sync.py
 
 # Importing modules
-from models import HousePool, HDData
-from utils import engine
+import logging
 from control_protocol import ControlPacket
+from connection_pool import pool, control_params, SendResult
+from house_registry import registry
+from state_store import store
+from metrics import metrics
 
-# Importing Libraries
-from sqlalchemy.orm import sessionmaker
-import socket
+log = logging.getLogger(__name__)
 
-# Making session
-Session = sessionmaker(bind = engine)
-session = Session()
+SYNC_LATENCY = metrics.histogram('area_clk_sync_seconds', 'Time of one clock sync round')
+SYNC_FAILED = metrics.counter('area_clk_sync_failures_total', 'Houses that missed a clock sync round')
 
-def clk_sync() -> None:
+def clk_sync(deadline: float = control_params['clk_sync_deadline']) -> dict[int, SendResult]:
     """Sends clk sync packet to household subcontrollers.
 
+    The packet is sent to all houses concurrently, the round is over
+    when every house is done or the deadline passes.
+
     Args:
+        deadline (float): seconds the whole sync round may take
 
     Returns:
-        None:
+        dict[int, SendResult]: (sent, latency) per house_id
     """
 
     latest_clk: list[int] = []
-    house_ips: list[str] = []
-    data_objects = session.query(HDData)
+    house_ips: dict[str, int] = {}
 
-    for house in session.query(HousePool):
-        house_data = data_objects.filter(
-                HDData.house_id == house.id
-                ).order_by(HDData.timestamp.desc()).first()
+    for house_data in store.snapshot():
+        house_ip = registry.ip_of(house_data[4])
 
-        if house_data == None:
+        if house_ip == None:
             continue
 
-        latest_clk.append(house_data.timestamp)
-        house_ips.append(house.ip)
+        latest_clk.append(house_data[3])
+        house_ips[house_ip] = house_data[4]
+
+    if not latest_clk:
+        log.info('No house data yet, skipping clock sync')
+        return {}
 
     largest_clk: int = max(latest_clk)
     largest_clk += 60
     packet = ControlPacket()
     packet.add_clksync(largest_clk)
+    payload: bytes = packet.get_packet()
+
+    log.info('Setting time to: %d', largest_clk)
+    results = pool.send_many({ip: payload for ip in house_ips}, deadline)
+
+    report: dict[int, SendResult] = {house_ips[ip]: result for ip, result in results.items()}
+    synced: int = sum(1 for sent, _ in report.values() if sent)
+    slowest: float = max(latency for _, latency in report.values())
+    SYNC_LATENCY.observe(slowest)
+    SYNC_FAILED.inc(len(report) - synced)
+    log.info('Clock synced %d/%d houses in %.1f ms', synced, len(report), slowest * 1000)
 
-    print(f'Setting time to: {largest_clk}')
-    for ip in house_ips:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((ip, 42069))
-        sock.send(packet.get_packet())
-        sock.close()
+    return report
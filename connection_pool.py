@@ -0,0 +1,281 @@
+# connection_pool.py
+
+# imports
+import json
+import logging
+import select
+import socket
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from time import monotonic
+from typing import Callable, Optional, Self
+from log_pipeline import limiter
+from metrics import metrics
+
+# read config
+with open('control_param.json', 'r') as fd:
+    control_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+SEND_LATENCY = metrics.histogram('area_command_send_seconds', 'Time to send one control packet to a house')
+SEND_FAILED = metrics.counter('area_command_send_failures_total', 'Control packets that could not be sent')
+SEND_SKIPPED = metrics.counter('area_command_send_skipped_total', 'Control packets skipped during a reconnect backoff')
+
+# (sent, seconds from the start of the fan-out until done or the deadline)
+SendResult = tuple[bool, float]
+
+class HouseConnection():
+    """Connection state and send statistics of one house."""
+
+    def __init__(self: Self, ip: str) -> None:
+        self.ip: str = ip
+        self.sock: Optional[socket.socket] = None
+        self.lock: Lock = Lock()
+
+        # reconnect backoff
+        self.backoff: float = 0
+        self.retry_at: float = 0
+
+        # statistics
+        self.sent: int = 0
+        self.failures: int = 0
+        self.skipped: int = 0
+        self.last_latency: float = 0
+        self.max_latency: float = 0
+        self.total_latency: float = 0
+
+    def close(self: Self) -> None:
+        if self.sock != None:
+            self.sock.close()
+            self.sock = None
+
+class HouseConnectionPool():
+    """Keeps one TCP connection per house subcontroller.
+
+    Connections are reused while the house keeps them open. A failed send
+    closes the connection and puts the house in an exponential backoff,
+    during which sends to it fail immediately instead of blocking.
+    """
+
+    def __init__(
+            self: Self,
+            port: int = control_params['port'],
+            connect_timeout: float = control_params['connect_timeout'],
+            send_timeout: float = control_params['send_timeout'],
+            keep_alive: bool = control_params['keep_alive'],
+            backoff_initial: float = control_params['backoff_initial'],
+            backoff_max: float = control_params['backoff_max'],
+            fanout_workers: int = control_params['fanout_workers']
+            ) -> None:
+        """Initialize the pool.
+
+        Args:
+            self (Self): self
+            port (int): control port of the houses
+            connect_timeout (float): seconds to wait for a connection
+            send_timeout (float): seconds to wait for a send
+            keep_alive (bool): keep connections open between sends
+            backoff_initial (float): first backoff after a failure in seconds
+            backoff_max (float): max backoff in seconds
+            fanout_workers (int): max concurrent sends in send_many
+        """
+
+        self.port: int = port
+        self.connect_timeout: float = connect_timeout
+        self.send_timeout: float = send_timeout
+        self.keep_alive: bool = keep_alive
+        self.backoff_initial: float = backoff_initial
+        self.backoff_max: float = backoff_max
+
+        self._connections: dict[str, HouseConnection] = {}
+        self._lock: Lock = Lock()
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+                max_workers = fanout_workers,
+                thread_name_prefix = 'fanout'
+                )
+
+    def send(self: Self, ip: str, payload: bytes) -> bool:
+        """Send a packet to a house.
+
+        Args:
+            self (Self): self
+            ip (str): ip of the house
+            payload (bytes): packet
+
+        Returns:
+            bool: True if the packet was sent
+        """
+
+        conn: HouseConnection = self._connection(ip)
+
+        with conn.lock:
+            start: float = monotonic()
+            if start < conn.retry_at:
+                conn.skipped += 1
+                SEND_SKIPPED.inc()
+                return False
+
+            try:
+                self._send(conn, payload)
+            except OSError as e:
+                conn.close()
+                conn.failures += 1
+                SEND_FAILED.inc()
+                conn.backoff = min(max(conn.backoff * 2, self.backoff_initial), self.backoff_max)
+                conn.retry_at = monotonic() + conn.backoff
+                if limiter.allow('send_failed'):
+                    log.warning("Send to %s failed, retrying in %.1f s: %s", ip, conn.backoff, e)
+                return False
+
+            latency: float = monotonic() - start
+            SEND_LATENCY.observe(latency)
+            conn.backoff = 0
+            conn.sent += 1
+            conn.last_latency = latency
+            conn.total_latency += latency
+            conn.max_latency = max(conn.max_latency, latency)
+
+            if not self.keep_alive:
+                conn.close()
+            return True
+
+    def send_many(
+            self: Self,
+            payloads: dict[str, bytes],
+            deadline: float,
+            on_late: Optional[Callable[[str, bool], None]] = None
+            ) -> dict[str, SendResult]:
+        """Send packets to many houses concurrently under one deadline.
+
+        Sends that did not start by the deadline are cancelled. Sends
+        still running at the deadline cannot be stopped, they are reported
+        as failed and finish in the background within the connect and
+        send timeouts, then on_late is called with their outcome.
+
+        Args:
+            self (Self): self
+            payloads (dict[str, bytes]): packet per house ip
+            deadline (float): seconds the whole fan-out may take
+            on_late (Optional[Callable[[str, bool], None]]): called with the
+                ip and the outcome of every send that finished after the
+                deadline, from a fan-out thread
+
+        Returns:
+            dict[str, SendResult]: result per house ip
+        """
+
+        start: float = monotonic()
+        results: dict[str, SendResult] = {}
+        results_lock: Lock = Lock()
+        reported: list[bool] = [False]
+
+        def send(ip: str, payload: bytes) -> None:
+            sent: bool = self.send(ip, payload)
+            with results_lock:
+                results[ip] = (sent, monotonic() - start)
+                late: bool = reported[0]
+            if late and on_late != None:
+                on_late(ip, sent)
+
+        futures: list[Future] = [
+                self._executor.submit(send, ip, payload)
+                for ip, payload in payloads.items()
+                ]
+        _, late = wait(futures, timeout = deadline)
+        for future in late:
+            future.cancel()
+
+        with results_lock:
+            report: dict[str, SendResult] = dict(results)
+            reported[0] = True
+        for ip in payloads:
+            if ip not in report:
+                report[ip] = (False, deadline)
+        return report
+
+    def close(self: Self) -> None:
+        """Close all connections.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            connections: list[HouseConnection] = list(self._connections.values())
+        for conn in connections:
+            with conn.lock:
+                conn.close()
+
+    def stats(self: Self) -> dict[str, dict[str, float]]:
+        """Get the send statistics per house.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, dict[str, float]]: statistics by ip, latencies in seconds
+        """
+
+        with self._lock:
+            connections: list[HouseConnection] = list(self._connections.values())
+
+        stats: dict[str, dict[str, float]] = {}
+        for conn in connections:
+            mean_latency: float = 0
+            if conn.sent > 0:
+                mean_latency = conn.total_latency / conn.sent
+            stats[conn.ip] = {
+                    'sent': conn.sent,
+                    'failures': conn.failures,
+                    'skipped': conn.skipped,
+                    'connected': conn.sock != None,
+                    'last_latency': conn.last_latency,
+                    'max_latency': conn.max_latency,
+                    'mean_latency': mean_latency
+                    }
+        return stats
+
+    def _connection(self: Self, ip: str) -> HouseConnection:
+        with self._lock:
+            conn: Optional[HouseConnection] = self._connections.get(ip)
+            if conn == None:
+                conn = HouseConnection(ip)
+                self._connections[ip] = conn
+            return conn
+
+    def _send(self: Self, conn: HouseConnection, payload: bytes) -> None:
+        """Send on the kept connection, reconnecting if it was closed.
+
+        Args:
+            self (Self): self
+            conn (HouseConnection): connection, caller holds its lock
+            payload (bytes): packet
+
+        Returns:
+            None:
+
+        Raises:
+            OSError: connect or send failed
+        """
+
+        # the houses never write to us, so a readable socket means
+        # the house closed or reset the connection since the last send,
+        # poll because select fails on descriptors above FD_SETSIZE
+        if conn.sock != None:
+            poller = select.poll()
+            poller.register(conn.sock, select.POLLIN)
+            if poller.poll(0):
+                conn.close()
+
+        if conn.sock == None:
+            conn.sock = socket.create_connection((conn.ip, self.port), timeout = self.connect_timeout)
+            conn.sock.settimeout(self.send_timeout)
+
+        conn.sock.sendall(payload)
+
+# process wide pool
+pool = HouseConnectionPool()
@@ -1,126 +1,71 @@
 # control_protocol.py
 
-from typing import Union, Optional, Self
+from typing import Iterable, Iterator, Union, Optional, Self
 import struct
 import json
+from param_oracle import ParamOracle, ParamSpec, oracle
 
-class ControlPacket():
-    """Control Protocol Packet.
-    """
+# clock sync, parameters, device state, devices and house selector
+KNOWN_FLAGS: int = 0x1f
 
-    # Global Variables
-    _packet: bytes = b''
-    _flags: int = 0
+# packet size per flags for packets without parameters and selector
+FIXED_SIZES: dict[int, int] = {
+        flags: 1 + (flags & 1) * 4 + (flags >> 3 & 1)
+        for flags in range(KNOWN_FLAGS + 1)
+        if not flags & 18 and not (flags & 4 and not flags & 8)
+        }
 
-    def __init__(self: Self, manifest_file: str = '') -> None:
-        """Initialize the packet.
+def selector_bitmap(house_ids: Iterable[int]) -> bytes:
+    """Encode house ids as a selector bitmap.
 
-        Args:
-            self (Self): self
-        """
+    House id h is bit h % 8 (least significant first) of byte h // 8.
 
-        # Read in the parameter oracle
-        with open('param_oracle.json', 'r') as fp:
-            self._param_oracle = json.load(fp)
+    Args:
+        house_ids (Iterable[int]): selected houses
 
-        if manifest_file != '':
-            self.create_from_manifest(manifest_file)
+    Returns:
+        bytes: bitmap, as long as the highest id needs
 
-    def __repr__(self: Self) -> str:
-        """Represent packet as a hex string
-
-        Args:
-            self (Self): self
-
-        Returns:
-            str: packet as hex
-        """
-
-        return self.get_packet().hex()
-
-    def get_packet(self: Self) -> bytes:
-        """Method to get the full packet.
-
-        Args:
-            self (Self): self
-
-        Returns:
-            bytes: Packet with flags appended
-        """
+    Raises:
+        ValueError: Negative house id or too many houses for the length field
+    """
 
-        return self._flags.to_bytes(1, 'big') + self._packet
+    house_ids = list(house_ids)
+    if not house_ids:
+        return b''
+    if min(house_ids) < 0:
+        raise ValueError("Negative house id")
+
+    bitmap: bytearray = bytearray(max(house_ids) // 8 + 1)
+    if len(bitmap) > 0xffff:
+        raise ValueError("Selector bitmap over 65535 bytes")
+    for house_id in house_ids:
+        bitmap[house_id >> 3] |= 1 << (house_id & 7)
+    return bytes(bitmap)
+
+class PacketBuilder():
+    """Collects the fields of a control packet and serializes them once.
+
+    Parameters are kept by id, so adding one is O(1) and a parameter with
+    an id that is already set replaces it. build() sorts the parameters
+    and writes the packet into a preallocated bytearray.
+    """
 
-    def print_packet(self: Self) -> None:
-        """Method for printing packet in a readable manner.
+    def __init__(self: Self, param_oracle: ParamOracle = oracle) -> None:
+        """Initialize the builder.
 
         Args:
             self (Self): self
-
-        Returns:
-            None:
+            param_oracle (ParamOracle): parameter ids, names and types
         """
 
-        # Decompile Parameters
-        decompiled: tuple[Optional[bytes], Optional[list[bytes]], Optional[bytes]] = self._decompile()
-        clk: Optional[bytes] = decompiled[0]
-        paramlist: Optional[list[bytes]] = decompiled[1]
-        devices: Optional[bytes] = decompiled[2]
-
-        # Print the flags in binary notation
-        print("--- Packet Breakdown ---")
-        print("Flags:")
-        print(f"{self._flags:08b}")
-        print()
-
-        # Print clk sync in binary notation
-        if clk:
-            clk_int: int = int.from_bytes(clk, 'big')
-            print("CLK Sync:")
-            print(f"{clk_int:032b} ({clk_int})")
-            print("")
-
-        # Print sim parameters in binary
-        if paramlist:
-
-            # Print the number of parameters
-            paramnum: int = len(paramlist)
-            print("Number of parameters:")
-            print(f"{paramnum:08b} ({paramnum})")
-            print("")
-
-            # Print each parameter
-            print("Param ID\tParam Size\tParam Data")
-            for param in paramlist:
-                paramid: int = param[0]
-                print(f"{paramid:08b} ({paramid})\t", end="")
-                paramsize: int = param[1]
-                print(f"{paramsize:08b} ({paramsize})\t", end="")
-                # Print each byte as binary
-                for byte in param[2:]:
-                    print(f"{byte:08b}", end="")
-                print("")
-            print("")
-
-        # Print devices in binary notation
-        if devices:
-            devices_int: int = int.from_bytes(devices, 'big')
-            print("Devices:")
-            print(f"{devices_int:08b}")
-            print("")
-
-    def create_from_manifest(self: Self, manifest_file: str) -> None:
-        with open(manifest_file, 'r') as fp:
-            manifest: dict = json.load(fp)
-
-        self.add_clksync(manifest["time"])
-
-        for param in manifest["parameters"]:
-            self.add_parameter(param["name"], param["value"])
-
-        self.add_devices(
-                manifest["device_signals"]["state"],
-                manifest["device_signals"]["devices"]
-                )
+        self.param_oracle: ParamOracle = param_oracle
+        self.flags: int = 0
+        self._clk: Optional[bytes] = None
+        self._params: dict[int, bytes] = {}
+        self._devices: Optional[bytes] = None
+        self._selector: Optional[bytes] = None
+        self._built: Optional[bytes] = None
 
     def add_clksync(self: Self, clk: int) -> None:
         """Adds clock syncronization parameter
@@ -133,17 +78,9 @@ class ControlPacket():
             None:
         """
 
-        # Extract flags to a temp variable
-        newflags: int = self._flags
-
-        # Set the flag bit
-        newflags |= 1
-
-        # Recompile packet with new clock sync
-        self._recompile(newflags, clk = clk.to_bytes(4, 'big'))
-
-        # Save the new flags
-        self._flags: int = newflags
+        self._clk = clk.to_bytes(4, 'big')
+        self.flags |= 1
+        self._built = None
 
     def add_parameter(
             self: Self,
@@ -164,57 +101,25 @@ class ControlPacket():
             ValueError: Invalid id
         """
 
-        # Extract flags to a temp variable
-        newflags: int = self._flags
-
-        # Set the flag bit
-        newflags |= 2
-
         # Create a new parameter
         param: bytes = b''
 
-        # Variable to hold the name of the param
-        pname: str = ''
-
-        # Make variable to hold the param type
-        ptype: str = ''
-
-        # Make variable to check if the id is valid
-        valid: bool = False
-
-        # Check if id is valid
+        # Look the parameter up by id or by name
         match param_id:
-            # If we use a integer as the id
-            case int():
-                for item in self._param_oracle.items():
-                    if item[1]['id'] == param_id:
-                        valid: bool = True
-                        pname: str = item[0]
-                        ptype: str = item[1]['type']
-                        break
-
-            # If we used the name
-            case str():
-                # Set the pname to the param_id
-                pname: str = param_id
-
-                # Find the correct id for the name
-                item = self._param_oracle.get(pname, None)
-
-                # If we found the item set valid, param_id and type
-                if item:
-                    valid: bool = True
-                    param_id: int = item['id']
-                    ptype: str = item['type']
+            case int() | str():
+                spec: Optional[ParamSpec] = self.param_oracle.lookup(param_id)
 
             case _:
                 # TODO: better error
                 raise ValueError("Hell is burning")
 
         # if it is not a valid id raise an error
-        if not valid:
+        if spec == None:
             raise ValueError("Invalid param id or param name")
 
+        # Get the id, name and type of the param
+        param_id, pname, ptype = spec
+
         # Add id to the parameter
         param += param_id.to_bytes(1, 'big')
 
@@ -262,10 +167,26 @@ class ControlPacket():
         param += psize.to_bytes(1, 'big')
         param += pdata
 
-        self._recompile(newflags, param = param)
+        # Replace a parameter with the same id or add it
+        self._params[param_id] = param
+        self.flags |= 2
+        self._built = None
+
+    def add_encoded_parameter(self: Self, param_id: int, param_data: bytes) -> None:
+        """Adds a parameter as it is on the wire, without checking the oracle.
+
+        Args:
+            self (Self): self
+            param_id (int): ID of the parameter
+            param_data (bytes): The encoded data of the parameter
+
+        Returns:
+            None:
+        """
 
-        # Save the new flags
-        self._flags: int = newflags
+        self._params[param_id] = bytes((param_id, len(param_data))) + param_data
+        self.flags |= 2
+        self._built = None
 
     def add_devices(self: Self, onoff: bool, devices: int) -> None:
         """Adds device parameter
@@ -279,183 +200,526 @@ class ControlPacket():
             None:
         """
 
-        # Extract flags to a temp variable
-        newflags: int = self._flags
+        self._devices = devices.to_bytes(1, 'big')
+        self.flags |= 8
+        if onoff: self.flags |= 4
+        else: self.flags &= ~4
+        self._built = None
 
-        # Set the flag bits
-        newflags |= 8
-        if onoff: newflags |= 4
-        else: newflags &= ~4
+    def add_selector(self: Self, house_ids: Iterable[int]) -> None:
+        """Adds a house selector, only the selected houses act on the packet
 
-        # Recompile packet with new devices
-        self._recompile(newflags, devices = devices.to_bytes(1, 'big'))
+        Args:
+            self (Self): self
+            house_ids (Iterable[int]): selected houses
+
+        Returns:
+            None:
+        """
 
-        # Save the new flags
-        self._flags: int = newflags
+        self.add_encoded_selector(selector_bitmap(house_ids))
 
-    def _decompile(self: Self) -> tuple[Optional[bytes], Optional[list[bytes]], Optional[bytes]]:
-        """Decompiles the packet and extracts parameters
+    def add_encoded_selector(self: Self, bitmap: bytes) -> None:
+        """Adds a house selector as it is on the wire.
 
         Args:
             self (Self): self
+            bitmap (bytes): selector bitmap
 
         Returns:
-            tuple[Optional[bytes], Optional[list[bytes]], Optional[bytes]]: Decompiled parameters
+            None:
         """
 
-        # Set variables
-        cursor: int = 0
-        clk: Optional[bytes] = None
-        devices: Optional[bytes] = None
-        paramlist: Optional[bytes] = None
+        self._selector = bitmap
+        self.flags |= 16
+        self._built = None
+
+    def build(self: Self) -> bytes:
+        """Serialize the packet, flags first.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            bytes: Packet
+        """
 
-        # Decompile clock sync
-        if self._flags & 1 > 0:
-            clk: bytes = self._packet[cursor:cursor+4]
+        if self._built != None:
+            return self._built
+
+        # Parameters ordered by id
+        params: list[bytes] = [self._params[param_id] for param_id in sorted(self._params)]
+
+        # Calculate the size up front
+        size: int = 1
+        if self._clk != None:
+            size += 4
+        if params:
+            size += 1 + sum(len(param) for param in params)
+        if self._devices != None:
+            size += 1
+        if self._selector != None:
+            size += 2 + len(self._selector)
+
+        packet: bytearray = bytearray(size)
+        packet[0] = self.flags
+        cursor: int = 1
+
+        if self._clk != None:
+            packet[cursor:cursor+4] = self._clk
             cursor += 4
 
-        # Decompile params
-        if self._flags & 2 > 0:
-            paramnum: int = self._packet[cursor]
+        if params:
+            packet[cursor] = len(params)
+            cursor += 1
+            for param in params:
+                packet[cursor:cursor+len(param)] = param
+                cursor += len(param)
+
+        if self._devices != None:
+            packet[cursor] = self._devices[0]
             cursor += 1
 
-            # Make variable to collect parameters in
-            paramlist: list[bytes] = []
+        if self._selector != None:
+            packet[cursor:cursor+2] = len(self._selector).to_bytes(2, 'big')
+            packet[cursor+2:] = self._selector
 
-            # Loop over all parameters
-            for _ in range(paramnum):
+        self._built = bytes(packet)
+        return self._built
 
-                # Collect their id and size
-                paramid: int = self._packet[cursor]
-                paramsize: int = self._packet[cursor+1]
-                cursor += 2
+class PacketView():
+    """Read only view of a serialized control packet.
 
-                # Collect the data bytes
-                paramdata: bytes = self._packet[cursor:cursor+paramsize]
-                cursor += paramsize
+    The packet is validated against its flags once, keeping only offsets.
+    The clock, parameters and devices are read from the underlying buffer
+    when they are accessed, parameter data is returned as memoryviews
+    into the buffer without copying.
 
-                # Recreate the parameter bytes
-                parambytes: bytes = paramid.to_bytes(1, 'big') + paramsize.to_bytes(1, 'big') + paramdata
+    The validation costs throughput: for the small packets the controller
+    sends a view is made and read at under half the rate of a plain split
+    of the fields, it only pays off for many or large parameters, see
+    benchmark.py parse.
+    """
 
-                # Add the bytes to the list
-                paramlist.append(parambytes)
+    # offsets of absent fields, set per instance only for present ones
+    _clk: int = -1
+    _params: tuple = ()
+    _devices: int = -1
+    _selector: int = -1
+    _selector_size: int = 0
 
-        # Decompile devices
-        if self._flags & 8 > 0:
-            devices: bytes = self._packet[cursor].to_bytes(1, 'big')
+    def __init__(self: Self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Validate the packet and locate its fields.
+
+        Args:
+            self (Self): self
+            data (Union[bytes, bytearray, memoryview]): serialized packet
+
+        Raises:
+            ValueError: Packet does not match its flags
+        """
+
+        if not data:
+            raise ValueError("Empty packet")
+
+        self._buffer: Union[bytes, bytearray, memoryview] = data
+        size: int = len(data)
+        flags: int = data[0]
+
+        # clock and devices only, the packets the controller sends,
+        # have a size that follows from the flags
+        expected: Optional[int] = FIXED_SIZES.get(flags)
+        if expected != None:
+            if size != expected:
+                raise ValueError(f"Packet is {size} bytes, its flags need {expected}")
+            if flags & 1:
+                self._clk = 1
+            if flags & 8:
+                self._devices = expected - 1
+            return
+
+        if flags & ~KNOWN_FLAGS:
+            raise ValueError(f"Unknown flags {flags:08b}")
+        if flags & 4 and not flags & 8:
+            raise ValueError("Device state without devices")
+
+        cursor: int = 1
+
+        # Clock sync, 4 bytes
+        if flags & 1:
+            self._clk = cursor
+            cursor += 4
+
+        # Parameter count then (id, size, data) per parameter
+        if flags & 2:
+            if cursor >= size:
+                raise ValueError("Packet too short for parameter count")
+            paramnum: int = data[cursor]
+            cursor += 1
+
+            # Parameters are written ordered by id, each id once
+            params: list[tuple[int, int, int]] = []
+            last_id: int = -1
+            for _ in range(paramnum):
+                if cursor + 2 > size:
+                    raise ValueError("Packet too short for parameter header")
+                paramid: int = data[cursor]
+                if paramid <= last_id:
+                    raise ValueError(f"Parameter {paramid} out of order")
+                last_id = paramid
+                paramsize: int = data[cursor+1]
+                params.append((paramid, cursor + 2, paramsize))
+                cursor += 2 + paramsize
+            self._params = params
+            if cursor > size:
+                raise ValueError(f"Packet too short for parameter {last_id}")
+
+        # Device signal, 1 byte
+        if flags & 8:
+            self._devices = cursor
             cursor += 1
 
-        # Return the decompiled packet
-        return (clk, paramlist, devices)
+        # House selector, 2 byte length then the bitmap
+        if flags & 16:
+            if cursor + 2 > size:
+                raise ValueError("Packet too short for selector length")
+            self._selector_size = int.from_bytes(data[cursor:cursor+2], 'big')
+            self._selector = cursor + 2
+            cursor += 2 + self._selector_size
+
+        if cursor > size:
+            raise ValueError("Packet too short for its flags")
+        if cursor != size:
+            raise ValueError(f"{size - cursor} bytes after the packet")
+
+    @property
+    def flags(self: Self) -> int:
+        return self._buffer[0]
+
+    @property
+    def clk(self: Self) -> Optional[int]:
+        if self._clk < 0:
+            return None
+        return int.from_bytes(self._buffer[self._clk:self._clk+4], 'big')
+
+    @property
+    def devices(self: Self) -> Optional[int]:
+        if self._devices < 0:
+            return None
+        return self._buffer[self._devices]
+
+    @property
+    def onoff(self: Self) -> Optional[bool]:
+        if self._devices < 0:
+            return None
+        return self.flags & 4 > 0
+
+    @property
+    def selector(self: Self) -> Optional[memoryview]:
+        if self._selector < 0:
+            return None
+        return memoryview(self._buffer)[self._selector:self._selector+self._selector_size]
+
+    def selects(self: Self, house_id: int) -> bool:
+        """Check if a house has to act on the packet.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+
+        Returns:
+            bool: True if the house is selected or the packet has no selector
+        """
+
+        if self._selector < 0:
+            return True
+        if house_id < 0 or house_id >> 3 >= self._selector_size:
+            return False
+        return self._buffer[self._selector + (house_id >> 3)] >> (house_id & 7) & 1 == 1
+
+    def __len__(self: Self) -> int:
+        return len(self._params)
+
+    def params(self: Self) -> Iterator[tuple[int, memoryview]]:
+        """Iterate the parameters in packet order.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            Iterator[tuple[int, memoryview]]: (id, data) per parameter
+        """
+
+        if not self._params:
+            return iter(())
+        data: memoryview = memoryview(self._buffer)
+        return ((paramid, data[offset:offset+size]) for paramid, offset, size in self._params)
+
+    def param(self: Self, param_id: int) -> Optional[memoryview]:
+        """Get the data of one parameter.
+
+        Args:
+            self (Self): self
+            param_id (int): ID of the parameter
+
+        Returns:
+            Optional[memoryview]: parameter data, None if not in the packet
+        """
+
+        for paramid, offset, size in self._params:
+            if paramid == param_id:
+                return memoryview(self._buffer)[offset:offset+size]
+        return None
+
+    def value(
+            self: Self,
+            param_id: int,
+            param_oracle: ParamOracle = oracle
+            ) -> Optional[Union[bool, int, float]]:
+        """Decode one parameter with its type from the oracle.
+
+        Args:
+            self (Self): self
+            param_id (int): ID of the parameter
+            param_oracle (ParamOracle): parameter ids, names and types
+
+        Returns:
+            Optional[Union[bool, int, float]]: value, None if not in the packet
+
+        Raises:
+            ValueError: Parameter is unknown or its size does not fit its type
+        """
+
+        data: Optional[memoryview] = self.param(param_id)
+        if data == None:
+            return None
+
+        spec: Optional[ParamSpec] = param_oracle.lookup(param_id)
+        if spec == None:
+            raise ValueError(f"Invalid param id {param_id}")
+
+        match spec[2]:
+            case 'float':
+                if len(data) != 8:
+                    raise ValueError(f"{spec[1]} ({param_id}) is {len(data)} bytes, not 8")
+                return struct.unpack('>d', data)[0]
+            case 'bool':
+                return int.from_bytes(data, 'big') > 0
+            case _:
+                return int.from_bytes(data, 'big')
+
+class ControlPacket():
+    """Control Protocol Packet.
+    """
+
+    def __init__(self: Self, manifest_file: str = '') -> None:
+        """Initialize the packet.
+
+        Args:
+            self (Self): self
+        """
+
+        # Fields are collected here and serialized once on get_packet,
+        # parameters are looked up in the shared oracle
+        self._builder: PacketBuilder = PacketBuilder()
+
+        if manifest_file != '':
+            self.create_from_manifest(manifest_file)
+
+    def __repr__(self: Self) -> str:
+        """Represent packet as a hex string
+
+        Args:
+            self (Self): self
+
+        Returns:
+            str: packet as hex
+        """
+
+        return self.get_packet().hex()
+
+    def get_packet(self: Self) -> bytes:
+        """Method to get the full packet.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            bytes: Packet with flags appended
+        """
+
+        return self._builder.build()
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, bytearray, memoryview]) -> Self:
+        """Parse a serialized packet.
+
+        The fields are copied into a builder so they can be changed, use
+        PacketView to only read a packet.
+
+        Args:
+            data (Union[bytes, bytearray, memoryview]): serialized packet
+
+        Returns:
+            Self: packet with the same fields
+
+        Raises:
+            ValueError: Packet does not match its flags
+        """
+
+        view: PacketView = PacketView(data)
+        packet: Self = cls()
+
+        if view.clk != None:
+            packet.add_clksync(view.clk)
+
+        for param_id, param_data in view.params():
+            packet._builder.add_encoded_parameter(param_id, bytes(param_data))
+
+        if view.devices != None:
+            packet.add_devices(view.onoff, view.devices)
+
+        if view.selector != None:
+            packet._builder.add_encoded_selector(bytes(view.selector))
+
+        return packet
+
+    def print_packet(self: Self) -> None:
+        """Method for printing packet in a readable manner.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        # Parse the packet
+        view: PacketView = PacketView(self.get_packet())
+
+        # Print the flags in binary notation
+        print("--- Packet Breakdown ---")
+        print("Flags:")
+        print(f"{view.flags:08b}")
+        print()
+
+        # Print clk sync in binary notation
+        if view.clk != None:
+            clk_int: int = view.clk
+            print("CLK Sync:")
+            print(f"{clk_int:032b} ({clk_int})")
+            print("")
+
+        # Print sim parameters in binary
+        if len(view) > 0:
 
-    def _recompile(self: Self, newflags: int, **kwargs: bytes) -> None:
-        """Recompiles the packet with new parameters
+            # Print the number of parameters
+            paramnum: int = len(view)
+            print("Number of parameters:")
+            print(f"{paramnum:08b} ({paramnum})")
+            print("")
+
+            # Print each parameter
+            print("Param ID\tParam Size\tParam Data")
+            for paramid, paramdata in view.params():
+                print(f"{paramid:08b} ({paramid})\t", end="")
+                paramsize: int = len(paramdata)
+                print(f"{paramsize:08b} ({paramsize})\t", end="")
+                # Print each byte as binary
+                for byte in paramdata:
+                    print(f"{byte:08b}", end="")
+                print("")
+            print("")
+
+        # Print devices in binary notation
+        if view.devices != None:
+            devices_int: int = view.devices
+            print("Devices:")
+            print(f"{devices_int:08b}")
+            print("")
+
+        # Print selected houses
+        if view.selector != None:
+            selected: list[int] = [
+                    byte_index * 8 + bit
+                    for byte_index, byte in enumerate(view.selector)
+                    for bit in range(8) if byte >> bit & 1
+                    ]
+            print("Selected houses:")
+            print(selected)
+            print("")
+
+    def create_from_manifest(self: Self, manifest_file: str) -> None:
+        with open(manifest_file, 'r') as fp:
+            manifest: dict = json.load(fp)
+
+        self.add_clksync(manifest["time"])
+
+        for param in manifest["parameters"]:
+            self.add_parameter(param["name"], param["value"])
+
+        self.add_devices(
+                manifest["device_signals"]["state"],
+                manifest["device_signals"]["devices"]
+                )
+
+    def add_clksync(self: Self, clk: int) -> None:
+        """Adds clock syncronization parameter
 
         Args:
             self (Self): self
-            kwargs (Union[bytes, list[bytes]]): Data to add
+            clk (int): clock time
+
+        Returns:
+            None:
+        """
+
+        self._builder.add_clksync(clk)
+
+    def add_parameter(
+            self: Self,
+            param_id: Union[int, str],
+            param_data: Union[bool, int, float]
+            ) -> None:
+        """Adds a new parameter.
+
+        Args:
+            self (Self): self
+            param_id (int): ID of the parameter
+            param_data (Union[float, int, bool]): The data of the parameter
 
         Returns:
             None:
 
         Raises:
-            ValueError: Packet part is not set
+            ValueError: Invalid id
+        """
+
+        self._builder.add_parameter(param_id, param_data)
+
+    def add_devices(self: Self, onoff: bool, devices: int) -> None:
+        """Adds device parameter
+
+        Args:
+            self (Self): self
+            onoff (bool): Should the devices be turned on or off?
+            devices (int): Devices to affect
+
+        Returns:
+            None:
+        """
+
+        self._builder.add_devices(onoff, devices)
+
+    def add_selector(self: Self, house_ids: Iterable[int]) -> None:
+        """Adds house selector, only the selected houses act on the packet
+
+        Args:
+            self (Self): self
+            house_ids (Iterable[int]): Houses to affect
+
+        Returns:
+            None:
         """
 
-        # Decompile the parameters
-        decompiled: tuple[Optional[bytes], Optional[list[bytes]], Optional[bytes]] = self._decompile()
-        clk: Optional[bytes] = decompiled[0]
-        paramlist: Optional[list[bytes]] = decompiled[1]
-        devices: Optional[bytes] = decompiled[2]
-
-        # Reset packet
-        self._packet: bytes = b''
-
-        # Add new clock or add the old one back
-        if newflags & 1 > 0:
-
-            # Extract new clock from the arguments
-            clk: bytes = kwargs.get('clk', clk)
-
-            # Check that the clock is set,
-            # either from arguments or decompiled packet
-            if not clk:
-                raise ValueError('clk not set')
-
-            # Add the clock bytes
-            self._packet += clk
-
-        # Add new parameter to the list,
-        # or compile the old one back
-        if newflags & 2 > 0:
-
-            # Extract parameter from the arguments
-            param: bytes = kwargs.get('param', None)
-
-            # Check if we have a parameter list from the packet
-            if not paramlist:
-
-                # Make sure that we have a new parameter set
-                if not param:
-                    raise ValueError('paramlist or param not set')
-
-                # Make an empty parameter list
-                paramlist = []
-
-            # Check that we have a new parameter set
-            if param:
-                # Make index variable to track where
-                # the new parameter needs to be inserted
-                index = -1
-
-                # Loop through all parameter and check
-                # if we already have one with the same id
-                for i, p in enumerate(paramlist):
-                    if p[0] == param[0]:
-                        # If we do save the index
-                        index = i
-                        break
-
-                if index > 0:
-                    # If we saved an index replaced the parameter
-                    # at that index with our new parameter
-                    paramlist: list[bytes] = paramlist[:i] + \
-                            [param] + \
-                            paramlist[i+1:]
-                else:
-                    # Else just append it
-                    paramlist.append(param)
-
-            # Write the parameter length
-            self._packet += len(paramlist).to_bytes(1, 'big')
-
-            # Sort and reorder the parameters by id
-            # Make a list to hold the ordering
-            # contents: (id, index)
-            order_list: list[tuple[int, int]] = []
-
-            # Loop over all parameters,
-            # add their id and index to the list
-            for i, p in enumerate(paramlist):
-                order_list.append((p[0], i))
-
-            # Sort the list by the id
-            order_list.sort(key=lambda x: x[0])
-
-            # Add the parameters in order from the list
-            for _, index in order_list:
-                self._packet += paramlist[index]
-
-        # Add new device signal or add the old one back
-        if newflags & 8 > 0:
-
-            # Extract device signal from arguments
-            devices: bytes = kwargs.get('devices', devices)
-
-            # Check that a device signal is set,
-            # either from arguments or decompiled packet
-            if not devices:
-                raise ValueError('devices not set')
-
-            # Add device signal bytes
-            self._packet += devices
+        self._builder.add_selector(house_ids)
@@ -2,216 +2,154 @@
 
 # imports
 import json
-import socket
+import logging
 from sqlalchemy.orm import sessionmaker
-from models import HousePool, HDData, ActionPool
+from models import ActionPool
 from utils import engine
-from control_protocol import ControlPacket
-from time import time
+from decision import decide
+from group_command import dispatch
+from house_state import HouseStateRegistry, house_states
+from log_pipeline import limiter
+from metrics import metrics
+from rolling_stats import rolling
+from state_store import store
+from time import time, monotonic
 
 # global variables
 action_flag = None
 
+# monotonic time of the last command sent to each house
+last_command: dict[int, float] = {}
+
 # read config
 with open('anal_param.json', 'r') as fd:
     params: dict = json.load(fd)
 
+log = logging.getLogger(__name__)
+
+READ_LATENCY = metrics.histogram('area_get_data_seconds', 'Time to get the latest data of every house')
+DECISION_LATENCY = metrics.histogram('area_decision_seconds', 'Time to decide which houses to switch')
+DISPATCH_LATENCY = metrics.histogram('area_dispatch_seconds', 'Time to deliver the commands of one decision')
+SWITCHED = metrics.counter('area_houses_switched_total', 'Houses switched on or off')
+
 # create session for database
 Session = sessionmaker(bind = engine)
 session = Session()
 
 def get_data_from_houses() -> list[tuple[int, float, float, int, int]]:
-    """function for getting data from house.
+    """function for getting the latest data from every house.
 
-    Args:
-        house_id (int): house_id
+    Reads the in-memory latest-state store, no database queries.
 
     Returns:
-        tuple[int, float, float, int] | None:
+        list[tuple[int, float, float, int, int]]: latest sample per house
     """
-    data_list = []
-    for house in session.query(HousePool):
-        data_object = session.query(HDData).filter(
-                HDData.house_id == house.id
-                ).order_by(
-                        HDData.timestamp.desc()
-                        ).first()
-        if data_object == None:
-            continue
-
-        data_list.append((data_object.device_state,
-                          data_object.power_usage,
-                          data_object.temperature,
-                          data_object.timestamp,
-                          data_object.house_id
-                         ))
-    return data_list
-
-def param_check(data: list[tuple[int, float, float, int, int]]) -> bool | None:
-    """checks if max temperature is reached.
+    return store.snapshot()
+
+def held(house_id: int) -> bool:
+    """checks if a house is still within its minimum hold time.
 
     Args:
-        data (list[tuple[int, float, float, int]]): data
+        house_id (int): house_id
 
     Returns:
-        bool:
+        bool: True if the house was switched less than min_hold seconds ago
     """
-    curr_consumption = 0
-    for house in data:
-        curr_consumption += house[1]
-
-    if params['min_usage'] < curr_consumption < params['max_usage']:
-        return None
-    if curr_consumption >= params['max_usage']:
-        return False
-    return True
-
-def send_command(off_houses: list) -> tuple[int, bool] | tuple[int, int] | None:
-
-    # variables
-    prio_var: float = 0
-    prio_ip: str | None = None
-    prio: int | None = None
-    house_data: list[tuple[int, float, float, int, int]] = get_data_from_houses()
-    onoff: bool | None = param_check(house_data)
-
-    if onoff == None:
-        if len(off_houses) == 0 or len(off_houses) == len(house_data):
-            return
-        switch_var = switch(house_data, off_houses)
-        if switch_var == None:
-            return
-        return switch_var
-
-    # checks whether to turn utilities of or on
-    if not onoff:
-
-        # loops over data to find most suitable house to turn off
-        for data in house_data:
-
-            # filter out houses already turned off
-            if data[4] in off_houses:
-                continue
-
-            if data[2] > prio_var:
-                prio_var = data[2]
-                prio = data[4]
-
-    # else statement if utilities have to be turned on
-    else:
-
-        # filters data to find houses that are turned off
-        filter_data = filter(lambda x: x[4] in off_houses, house_data)
-
-        # find suitable house to turn on
-        for data in filter_data:
-            if data[2] < prio_var or prio_var == 0:
-                prio_var = data[2]
-                prio = data[4]
-
-    if prio == None:
-        print(f"No candidate send, command: {onoff}")
-        return
-
-    # find ip of house to take an action within
-    house = session.query(HousePool).filter(HousePool.id == prio).first()
-    if house != None:
-        prio_ip = house.ip
+    switched = last_command.get(house_id)
+    return switched != None and monotonic() - switched < params['min_hold']
 
+def record_late(house_id: int, onoff: bool, states: HouseStateRegistry = house_states) -> None:
+    """records a command that was delivered after the dispatch deadline.
 
-    if prio_ip == None:
-        print(f"Worst case: {prio} does have an ip")
-        return
+    Called from a fan-out thread, so it uses its own session.
 
-    # create packet
-    packet = ControlPacket()
-    packet.add_devices(onoff, 1)
-
-    print(f"Command for {prio}, command: {onoff}")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((prio_ip, 42069))
-    sock.send(packet.get_packet())
-    sock.close()
-
-    # ActionPool entry
-    action_entry = ActionPool(
-            timestamp = time(),
-            device = 1,
-            state_change = onoff,
-            house_id = prio
-            )
-
-    session.add(action_entry)
-    session.commit()
+    Args:
+        house_id (int): house_id
+        onoff (bool): True if the house was switched on
+        states (HouseStateRegistry): on/off state of the houses
 
-    return prio, onoff
+    Returns:
+        None:
+    """
+    last_command[house_id] = monotonic()
+    states.set_state(house_id, onoff)
+    SWITCHED.inc()
 
-def switch(data_list: list[tuple[int, float, float, int, int]], off_houses: list) -> tuple[int, int] | None:
+    with Session() as late_session:
+        late_session.add(ActionPool(
+                timestamp = time(),
+                device = 1,
+                state_change = onoff,
+                house_id = house_id
+                ))
+        late_session.commit()
 
-    # variables
-    prio_var = 0
-    prio = None
-    cand_var = 0
-    cand = None
+    if limiter.allow('command'):
+        log.info("Late command delivered, house %d %s", house_id, "on" if onoff else "off")
 
-    for data in data_list:
-        if data[4] not in off_houses:
-            if data[2] > cand_var:
-                cand_var = data[2]
-                cand = data[4]
-        else:
-            if data[2] < prio_var or prio_var == 0:
-                prio_var = data[2]
-                prio = data[4]
+def send_command(states: HouseStateRegistry = house_states) -> tuple[list[int], list[int]] | None:
+    """switches every house needed to get back inside the usage band.
 
-    if prio == None or cand == None:
-        return
+    The decision engine picks all houses in one pass, their commands are
+    dispatched together and logged to the ActionPool in one commit.
 
-    if cand_var < prio_var:
-        return
+    Args:
+        states (HouseStateRegistry): on/off state of the houses, updated
+            for every house that got its command
 
-    houses = session.query(HousePool)
-    cand_data = houses.filter(HousePool.id == cand).first()
-    prio_data = houses.filter(HousePool.id == prio).first()
+    Returns:
+        tuple[list[int], list[int]] | None: houses turned off and houses turned on
+    """
 
-    if cand_data == None or prio_data == None:
+    with READ_LATENCY.time():
+        house_data: list[tuple[int, float, float, int, int]] = get_data_from_houses()
+        if params['smooth_decisions']:
+            # decide on the ewma of every house instead of its last sample
+            house_data = rolling.smoothed(house_data)
+
+    with DECISION_LATENCY.time():
+        states.observe(house_data)
+        switch_off, switch_on = decide(
+                house_data,
+                states,
+                params['min_usage'],
+                params['max_usage'],
+                params['nominal_load'],
+                held
+                )
+
+    if not switch_off and not switch_on:
         return
 
-    # create packets and sockets and send
-
-    packet = ControlPacket()
-    packet.add_devices(False, 1)
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((cand_data.ip, 42069))
-    sock.send(packet.get_packet())
-    sock.close()
-
-    packet.add_devices(True, 1)
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((prio_data.ip, 42069))
-    sock.send(packet.get_packet())
-    sock.close()
-
-    # create action entry
-
-    action_entry_cand = ActionPool(
-            timestamp = time(),
-            device = 1,
-            state_change = False,
-            house_id = cand
-            )
-
-    action_entry_prio = ActionPool(
-            timestamp = time(),
-            device = 1,
-            state_change = True,
-            house_id = prio
-            )
+    # many houses go out as one group datagram, few over their connections
+    with DISPATCH_LATENCY.time():
+        turned_off, turned_on = dispatch(
+                switch_off,
+                switch_on,
+                on_late = lambda house_id, onoff: record_late(house_id, onoff, states)
+                )
+    SWITCHED.inc(len(turned_off) + len(turned_on))
+
+    # only the houses that got their command are switched
+    action_entries: list[ActionPool] = []
+    now = monotonic()
+    for house_ids, onoff in ((turned_off, False), (turned_on, True)):
+        for house_id in house_ids:
+            last_command[house_id] = now
+            states.set_state(house_id, onoff)
+            action_entries.append(ActionPool(
+                    timestamp = time(),
+                    device = 1,
+                    state_change = onoff,
+                    house_id = house_id
+                    ))
+
+    if not action_entries:
+        return
 
-    session.add_all([action_entry_cand, action_entry_prio])
+    session.add_all(action_entries)
     session.commit()
 
-    print(f'Switching {prio} with {cand}')
-    return prio, cand
+    if limiter.allow('command'):
+        log.info("Commands sent, off: %s, on: %s", turned_off, turned_on)
+    return turned_off, turned_on
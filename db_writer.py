@@ -0,0 +1,200 @@
+# db_writer.py
+
+# imports
+import json
+import logging
+from threading import Thread
+from time import monotonic
+from typing import Optional, Self
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from ingest_queue import IngestQueue
+from log_pipeline import limiter
+from metrics import metrics
+from models import HDData
+from telemetry import Sample
+from utils import engine
+
+# read config
+with open('ingest_param.json', 'r') as fd:
+    ingest_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+FLUSH_LATENCY = metrics.histogram('area_db_flush_seconds', 'Time to commit one batch to hd_data')
+FLUSH_ROWS = metrics.counter('area_db_rows_written_total', 'Rows committed to hd_data')
+FLUSH_FAILED = metrics.counter('area_db_rows_failed_total', 'Rows lost in failed flushes')
+
+class BatchWriter(Thread):
+    """Writes decoded samples to hd_data in batches.
+
+    Samples are collected from a bounded IngestQueue and flushed as one
+    multi-row insert when either batch_size samples are waiting or
+    flush_interval seconds have passed since the first sample of the
+    batch arrived. When the database stalls the queue fills up and its
+    overflow policy decides which samples are lost.
+    """
+
+    def __init__(
+            self: Self,
+            batch_size: int = ingest_params['batch_size'],
+            flush_interval: float = ingest_params['flush_interval'],
+            db_engine: Engine = engine,
+            queue_size: int = ingest_params['queue_size'],
+            overflow_policy: str = ingest_params['overflow_policy']
+            ) -> None:
+        """Initialize the writer.
+
+        Args:
+            self (Self): self
+            batch_size (int): Max number of rows per flush
+            flush_interval (float): Max seconds a sample waits before flush
+            db_engine (Engine): Engine to write to
+            queue_size (int): Max number of samples waiting to be written
+            overflow_policy (str): IngestQueue overflow policy
+        """
+
+        super().__init__(daemon = True)
+
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self._engine: Engine = db_engine
+        self.queue: IngestQueue = IngestQueue(queue_size, overflow_policy)
+
+        # flush statistics
+        self.flush_count: int = 0
+        self.rows_written: int = 0
+        self.rows_failed: int = 0
+        self.last_flush_latency: float = 0
+        self.max_flush_latency: float = 0
+        self.total_flush_latency: float = 0
+        self._reported_drops: int = 0
+
+    def submit(self: Self, sample: Sample) -> bool:
+        """Queue a sample for writing, never blocks.
+
+        Args:
+            self (Self): self
+            sample (Sample): decoded sample
+
+        Returns:
+            bool: False if the sample was dropped by the overflow policy
+        """
+
+        return self.queue.put(sample)
+
+    def close(self: Self) -> None:
+        """Flush the remaining samples and stop the writer.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        self.queue.close()
+        self.join()
+
+    def stats(self: Self) -> dict[str, float]:
+        """Get the flush statistics.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, float]: statistics, latencies in seconds,
+                queue metrics prefixed with queue_
+        """
+
+        mean_latency: float = 0
+        if self.flush_count > 0:
+            mean_latency = self.total_flush_latency / self.flush_count
+
+        stats: dict[str, float] = {
+                'flush_count': self.flush_count,
+                'rows_written': self.rows_written,
+                'rows_failed': self.rows_failed,
+                'last_flush_latency': self.last_flush_latency,
+                'max_flush_latency': self.max_flush_latency,
+                'mean_flush_latency': mean_latency
+                }
+        for key, value in self.queue.stats().items():
+            stats[f'queue_{key}'] = value
+        return stats
+
+    def run(self: Self) -> None:
+        batch: list[Sample] = []
+        deadline: float = 0
+
+        while True:
+            # wait forever when idle, else until the batch is due
+            timeout: Optional[float] = None
+            if batch:
+                timeout = max(0, deadline - monotonic())
+
+            samples: Optional[list[Sample]] = self.queue.get_many(
+                    self.batch_size - len(batch),
+                    timeout
+                    )
+            if samples == None:
+                break
+
+            if samples and not batch:
+                deadline = monotonic() + self.flush_interval
+            batch.extend(samples)
+
+            if len(batch) >= self.batch_size or (batch and monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+        if batch:
+            self._flush(batch)
+
+    def _flush(self: Self, batch: list[Sample]) -> None:
+        """Write a batch as one multi-row insert.
+
+        Args:
+            self (Self): self
+            batch (list[Sample]): samples to write
+
+        Returns:
+            None:
+        """
+
+        rows: list[dict] = [{
+            'device_state': sample[0],
+            'power_usage': sample[1],
+            'temperature': sample[2],
+            'timestamp': sample[3],
+            'house_id': sample[4]
+            } for sample in batch]
+
+        start: float = monotonic()
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(insert(HDData), rows)
+        except Exception as e:
+            self.rows_failed += len(rows)
+            FLUSH_FAILED.inc(len(rows))
+            log.error("Flush of %d rows failed: %s", len(rows), e)
+            return
+        latency: float = monotonic() - start
+        FLUSH_LATENCY.observe(latency)
+        FLUSH_ROWS.inc(len(rows))
+
+        self.flush_count += 1
+        self.rows_written += len(rows)
+        self.last_flush_latency = latency
+        self.total_flush_latency += latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+        if limiter.allow('flush'):
+            log.info("Flushed %d rows in %.1f ms", len(rows), latency * 1000)
+
+        # make saturation visible instead of leaving gaps in hd_data
+        dropped: int = self.queue.dropped
+        if dropped > self._reported_drops:
+            log.warning("Ingest queue overflow: %d samples dropped (depth %d, high water %d)",
+                        dropped - self._reported_drops, len(self.queue), self.queue.high_water)
+            self._reported_drops = dropped
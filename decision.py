@@ -0,0 +1,122 @@
+# decision.py
+
+# imports
+from typing import Callable, Iterator
+from house_state import HouseStateRegistry
+
+# (device_state, power_usage, temperature, timestamp, house_id)
+HouseData = tuple[int, float, float, int, int]
+
+# (houses to switch off, houses to switch on)
+Decision = tuple[list[int], list[int]]
+
+def estimate_load(on_data: list[HouseData], nominal_load: float) -> float:
+    """Estimates the consumption of a house once it is switched on.
+
+    Args:
+        on_data (list[HouseData]): data of the houses that are on
+        nominal_load (float): fallback when no house is consuming
+
+    Returns:
+        float: expected consumption in kW
+    """
+
+    consuming: list[float] = [data[1] for data in on_data if data[1] > 0]
+    if not consuming:
+        return nominal_load
+    return sum(consuming) / len(consuming)
+
+def decide(
+        house_data: list[HouseData],
+        states: HouseStateRegistry,
+        min_usage: float,
+        max_usage: float,
+        nominal_load: float,
+        held: Callable[[int], bool] = lambda house_id: False
+        ) -> Decision:
+    """Picks every house to switch in one pass over the fleet.
+
+    Above max_usage the hottest consuming houses are switched off until
+    the total is below max_usage, idle houses are left on. At or below min_usage the coldest switched off houses
+    are switched on until the total is above min_usage, without going over
+    max_usage. Inside the band the hottest on houses are swapped with the
+    colder off houses, as long as the total stays inside the band.
+    Candidates come from the temperature heaps of the house states, so
+    picking k of n houses is O(n + k log n).
+
+    A house that was switched within its hold time and whose latest data
+    still shows its old device state counts with 0 if it was switched off
+    and with the expected load if it was switched on, so the next decision
+    does not switch again for houses that have not reported yet.
+
+    Args:
+        house_data (list[HouseData]): latest data per house, already
+            observed by states
+        states (HouseStateRegistry): on/off state of the houses
+        min_usage (float): lower bound of the band in kW
+        max_usage (float): upper bound of the band in kW
+        nominal_load (float): consumption of a house when no house is on
+        held (Callable[[int], bool]): True for houses that were switched
+            recently and may not switch yet
+
+    Returns:
+        Decision: houses to switch off and houses to switch on
+    """
+
+    # held houses whose telemetry still shows the state before their command
+    stale: set[int] = {data[4] for data in house_data
+                       if held(data[4]) and (data[0] & 1 > 0) == states.is_off(data[4])}
+
+    # a switched on house is expected to consume like the ones that are on
+    on_load: float = estimate_load(
+            [data for data in house_data if not states.is_off(data[4]) and data[4] not in stale],
+            nominal_load
+            )
+
+    # stale houses count with the power they will have, not the one they had
+    power: dict[int, float] = {data[4]: data[1] for data in house_data}
+    for house_id in stale:
+        power[house_id] = 0 if states.is_off(house_id) else on_load
+    total: float = sum(power.values())
+
+    # hottest on houses and coldest off houses first
+    on_houses: Iterator[int] = (house_id for house_id in states.hottest_on()
+                                if house_id in power and not held(house_id))
+    off_houses: Iterator[int] = (house_id for house_id in states.coldest_off()
+                                 if house_id in power and not held(house_id))
+
+    switch_off: list[int] = []
+    switch_on: list[int] = []
+
+    if total >= max_usage:
+        for house_id in on_houses:
+            if total < max_usage:
+                break
+            # switching off an idle house lowers nothing
+            if power[house_id] <= 0:
+                continue
+            switch_off.append(house_id)
+            total -= power[house_id]
+
+    elif total <= min_usage:
+        for house_id in off_houses:
+            if total > min_usage:
+                break
+            added: float = max(on_load - power[house_id], 0)
+            if total + added >= max_usage:
+                break
+            switch_on.append(house_id)
+            total += added
+
+    else:
+        for cand, prio in zip(on_houses, off_houses):
+            if states.temperature(cand) < states.temperature(prio):
+                break
+            swapped: float = total - power[cand] + max(on_load - power[prio], 0)
+            if not min_usage < swapped < max_usage:
+                break
+            switch_off.append(cand)
+            switch_on.append(prio)
+            total = swapped
+
+    return switch_off, switch_on
@@ -1,11 +1,20 @@
 # graph_dev.py
 
 import matplotlib.pyplot as plt
-from data_analysis import get_data_from_houses
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
 import json
-from models import HousePool, HDData
+import logging
+from itertools import chain
+from threading import Thread
+from time import monotonic, sleep, time
+from typing import Iterable, Iterator, Optional, Self
+from state_store import LatestStateStore, store
+from models import HDData, HDRollup1m, HDRollup1h, HousePool
 from utils import engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Select, func, select
+from sqlalchemy.engine import Connection, Engine
 
 with open('anal_param.json', 'r') as fd:
     anal_params = json.load(fd)
@@ -14,82 +23,410 @@ y_max_value = anal_params["max_usage"]
 y_min_value = anal_params["min_usage"]
 max_cap = anal_params["max_capacity"]
 
-y_max = []
-y_min = []
-x = []
-y = []
-
-def animate():
-    global x
-    global y
-    data = get_data_from_houses()
-    if len(data) > 0:
-        x.append(data[0][3])
-        consumption_sum = 0
-        for tuple in data:
-            consumption_sum += tuple[1]
-        y.append(consumption_sum)
-    else:
-        x.append(0)
-        y.append(0)
-
-
-def live_graph():
-    global x
-    global y
-    global y_max
-    global y_min
-    y_max = []
-    y_min = []
-    animate()
-    for i in x:
-        y_max.append(y_max_value)
-        y_min.append(y_min_value)
-
-    if len(x) > 1:
-        if x[-1] // 3540 >=1 and x[-1] % 3540 == 0:
-            plt.plot(x,y, '-b')
-            plt.plot(x,y_max,'--r')
-            plt.plot(x,y_min, '--y')
-            plt.plot(x,y_min, '--m')
-            plt.title("Power Consumption")
-            plt.ylabel("kW")
-            plt.xlabel("Seconds")
-            name = f"graph_file_{x[-1]//3540}.png"
-            plt.savefig(name, dpi=300)
-
-
-
-def post_plot():
-    Session = sessionmaker(bind = engine)
-    session = Session()
-    data_objects = session.query(HDData)
-    if len(data_objects.all()) == 0:
-        return
-    
-    y_list = []
-
-    timestamps = [ts.timestamp for ts in data_objects.distinct(HDData.timestamp)]
-    timestamps.sort()
-    for stamp in timestamps:
-        y = 0
-        for data in data_objects.filter(HDData.timestamp == stamp):
-            y += data.power_usage
-        y_list.append(y)
-
-    y_max = [y_max_value] * len(timestamps)
-    y_min = [y_min_value] * len(timestamps)
-    max_cap_list = [max_cap]*len(timestamps)
-
-    plt.plot(timestamps,y_list, '-b')
-    plt.plot(timestamps,y_max,'--r')
-    plt.plot(timestamps,y_min, '--y')
-    plt.plot(timestamps,max_cap_list, '--m')
-    plt.title("Power Consumption")
-    plt.ylabel("kW")
-    plt.xlabel("Seconds")
-    name = f"graph_file.png"
-    plt.savefig(name, dpi=300)
-
-
-post_plot()
+log = logging.getLogger(__name__)
+
+class RingBuffer():
+    """Fixed capacity series of the latest (x, y) points.
+
+    Every point is written twice, capacity apart, so the points in order
+    are always one contiguous slice and view() copies nothing.
+    """
+
+    def __init__(self: Self, capacity: int) -> None:
+        self.capacity: int = capacity
+        self._x: np.ndarray = np.zeros(2 * capacity)
+        self._y: np.ndarray = np.zeros(2 * capacity)
+        self._next: int = 0
+        self._count: int = 0
+
+    def __len__(self: Self) -> int:
+        return self._count
+
+    def append(self: Self, x: float, y: float) -> None:
+        """Add a point, dropping the oldest one when full.
+
+        Args:
+            self (Self): self
+            x (float): x value
+            y (float): y value
+
+        Returns:
+            None:
+        """
+
+        index: int = self._next
+        self._x[index] = self._x[index + self.capacity] = x
+        self._y[index] = self._y[index + self.capacity] = y
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def view(self: Self) -> tuple[np.ndarray, np.ndarray]:
+        """Get the points, oldest first.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: views of the x and y values
+        """
+
+        end: int = self._next + self.capacity
+        return self._x[end - self._count:end], self._y[end - self._count:end]
+
+class LiveGraph(Thread):
+    """Live plot of the area consumption over a sliding window.
+
+    Samples the total of the latest-state store every interval into a
+    ring buffer, so it never queries the database. The figure and its
+    lines are made once and only their data is replaced, the image is
+    written every save_interval seconds.
+    """
+
+    def __init__(
+            self: Self,
+            state_store: LatestStateStore = store,
+            window: float = anal_params['live_window'],
+            interval: float = anal_params['live_interval'],
+            save_interval: float = anal_params['live_save_interval'],
+            name: str = "live_graph.png",
+            dpi: int = 100
+            ) -> None:
+        """Initialize the graph.
+
+        Args:
+            self (Self): self
+            state_store (LatestStateStore): latest sample per house
+            window (float): seconds shown
+            interval (float): seconds between samples
+            save_interval (float): seconds between image writes
+            name (str): image file
+            dpi (int): image resolution
+        """
+
+        super().__init__(daemon = True)
+        self.state_store: LatestStateStore = state_store
+        self.interval: float = interval
+        self.save_interval: float = save_interval
+        self.name: str = name
+        self.dpi: int = dpi
+        self.points: RingBuffer = RingBuffer(max(2, int(window / interval)))
+
+        # not pyplot, the figure belongs to this thread only
+        self.figure: Figure = Figure()
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.line, = self.ax.plot([], [], '-b')
+        self.ax.axhline(y_max_value, linestyle = '--', color = 'r')
+        self.ax.axhline(y_min_value, linestyle = '--', color = 'y')
+        self.ax.axhline(max_cap, linestyle = '--', color = 'm')
+        self.ax.set_title("Power Consumption")
+        self.ax.set_ylabel("kW")
+        self.ax.set_xlabel("Seconds")
+
+    def sample(self: Self, now: float) -> None:
+        """Add the current area consumption.
+
+        Args:
+            self (Self): self
+            now (float): wall clock time
+
+        Returns:
+            None:
+        """
+
+        self.points.append(now, self.state_store.total_consumption())
+
+    def update(self: Self, *args) -> tuple:
+        """Move the line to the buffered points.
+
+        Usable as a FuncAnimation callback with blit = True.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            tuple: changed artists
+        """
+
+        x, y = self.points.view()
+        self.line.set_data(x, y)
+        if len(x) > 1:
+            self.ax.set_xlim(x[0], x[-1])
+            self.ax.set_ylim(0, max(max_cap, float(y.max())) * 1.1)
+        return (self.line,)
+
+    def save(self: Self) -> None:
+        """Write the image.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        self.update()
+        self.figure.savefig(self.name, dpi = self.dpi)
+
+    def run(self: Self) -> None:
+        last_save: float = monotonic()
+        while True:
+            sleep(self.interval)
+            self.sample(time())
+
+            if monotonic() - last_save >= self.save_interval:
+                last_save = monotonic()
+                try:
+                    self.save()
+                except Exception as e:
+                    log.exception("Saving %s failed: %s", self.name, e)
+
+def consumption_query(start: Optional[int] = None) -> Select:
+    """Total consumption per timestamp of the raw samples, summed by the database.
+
+    Args:
+        start (Optional[int]): first timestamp, all if None
+
+    Returns:
+        Select: (timestamp, consumption) rows ordered by timestamp
+    """
+
+    query: Select = select(HDData.timestamp, func.sum(HDData.power_usage))
+    if start != None:
+        query = query.where(HDData.timestamp >= start)
+    return query.group_by(HDData.timestamp).order_by(HDData.timestamp)
+
+def rollup_query(table: type, start: Optional[int], end: Optional[int]) -> Select:
+    """Total mean consumption per bucket of a rollup table.
+
+    Args:
+        table (type): HDRollup1m or HDRollup1h
+        start (Optional[int]): first bucket, unbounded if None
+        end (Optional[int]): bucket to stop before, unbounded if None
+
+    Returns:
+        Select: (bucket, consumption) rows ordered by bucket
+    """
+
+    query: Select = select(table.bucket, func.sum(table.mean_power))
+    if start != None:
+        query = query.where(table.bucket >= start)
+    if end != None:
+        query = query.where(table.bucket < end)
+    return query.group_by(table.bucket).order_by(table.bucket)
+
+def raw_range(conn: Connection) -> tuple[Optional[int], Optional[int]]:
+    """Get the oldest and the newest raw timestamp.
+
+    One index lookup per house instead of a scan of hd_data.
+
+    Args:
+        conn (Connection): connection
+
+    Returns:
+        tuple[Optional[int], Optional[int]]: oldest and newest timestamp,
+            None if hd_data is empty
+    """
+
+    oldest = (select(HDData.timestamp).where(HDData.house_id == HousePool.id)
+              .order_by(HDData.timestamp).limit(1).correlate(HousePool).scalar_subquery())
+    newest = (select(HDData.timestamp).where(HDData.house_id == HousePool.id)
+              .order_by(HDData.timestamp.desc()).limit(1).correlate(HousePool).scalar_subquery())
+    return tuple(conn.execute(select(func.min(oldest), func.max(newest)).select_from(HousePool)).one())
+
+def history_queries(conn: Connection) -> tuple[list[Select], Optional[int], Optional[int]]:
+    """Plan the queries covering the whole history, oldest first.
+
+    Raw samples are only kept for raw_retention_days, the minute rollups
+    for minute_retention_days. Every range is read from the finest data
+    still there: hour buckets before the first minute bucket, minute
+    buckets before the first raw sample, raw samples after it.
+
+    Args:
+        conn (Connection): connection
+
+    Returns:
+        tuple[list[Select], Optional[int], Optional[int]]: queries in time
+            order, and the first and last timestamp, None if there is no data
+    """
+
+    raw_oldest, raw_newest = raw_range(conn)
+    minute_oldest, minute_newest = conn.execute(select(func.min(HDRollup1m.bucket), func.max(HDRollup1m.bucket))).one()
+    hour_oldest, hour_newest = conn.execute(select(func.min(HDRollup1h.bucket), func.max(HDRollup1h.bucket))).one()
+
+    queries: list[Select] = []
+    hour_end: Optional[int] = minute_oldest if minute_oldest != None else raw_oldest
+    if hour_oldest != None and (hour_end == None or hour_oldest < hour_end):
+        queries.append(rollup_query(HDRollup1h, None, hour_end))
+    if minute_oldest != None and (raw_oldest == None or minute_oldest < raw_oldest):
+        queries.append(rollup_query(HDRollup1m, minute_oldest, raw_oldest))
+    if raw_oldest != None:
+        queries.append(consumption_query(raw_oldest))
+
+    firsts: list[int] = [t for t in (hour_oldest, minute_oldest, raw_oldest) if t != None]
+    lasts: list[int] = [t for t in (hour_newest, minute_newest, raw_newest) if t != None]
+    if not firsts:
+        return [], None, None
+    return queries, min(firsts), max(lasts)
+
+def downsample(
+        chunks: Iterable[np.ndarray],
+        start: float,
+        end: float,
+        points: int
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """Downsample a stream of points with Largest-Triangle-Three-Buckets.
+
+    The time from start to end is cut into points - 2 equal buckets. The
+    first and last point are kept, and from every bucket the point that
+    spans the largest triangle with the previously kept point and the mean
+    of the next bucket, so peaks and dips survive. Only the bucket waiting
+    for its successor and the one being filled are held, so memory does
+    not grow with the length of the history.
+
+    Args:
+        chunks (Iterable[np.ndarray]): (x, y) rows in ascending x
+        start (float): first x
+        end (float): last x
+        points (int): max points to keep, at least 3
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: downsampled x and y
+    """
+
+    buckets: int = max(points - 2, 1)
+    width: float = max((end - start) / buckets, 1e-9)
+    kept_x: list[float] = []
+    kept_y: list[float] = []
+
+    # bucket waiting for the next one, and the one being filled
+    waiting: Optional[tuple[np.ndarray, np.ndarray]] = None
+    filling: list[np.ndarray] = []
+    filling_index: int = -1
+    last: Optional[tuple[float, float]] = None
+
+    def keep(bucket: tuple[np.ndarray, np.ndarray], next_x: float, next_y: float) -> None:
+        x, y = bucket
+        a_x, a_y = kept_x[-1], kept_y[-1]
+        area: np.ndarray = np.abs((a_x - next_x) * (y - a_y) - (a_x - x) * (next_y - a_y))
+        best: int = int(area.argmax())
+        kept_x.append(float(x[best]))
+        kept_y.append(float(y[best]))
+
+    def close(rows: list[np.ndarray]) -> None:
+        nonlocal waiting
+        if not rows:
+            return
+        data: np.ndarray = np.concatenate(rows)
+        bucket: tuple[np.ndarray, np.ndarray] = (data[:, 0], data[:, 1])
+        if waiting != None:
+            keep(waiting, float(bucket[0].mean()), float(bucket[1].mean()))
+        waiting = bucket
+
+    for data in chunks:
+        if len(data) == 0:
+            continue
+        if last == None:
+            kept_x.append(float(data[0, 0]))
+            kept_y.append(float(data[0, 1]))
+            data = data[1:]
+            if len(data) == 0:
+                last = (kept_x[0], kept_y[0])
+                continue
+        last = (float(data[-1, 0]), float(data[-1, 1]))
+
+        index: np.ndarray = np.minimum(((data[:, 0] - start) // width).astype(np.intp), buckets - 1)
+        splits: np.ndarray = np.flatnonzero(np.diff(index)) + 1
+        for part, part_index in zip(np.split(data, splits), index[np.r_[0, splits]]):
+            if part_index != filling_index:
+                close(filling)
+                filling = []
+                filling_index = int(part_index)
+            filling.append(part)
+
+    close(filling)
+    if waiting != None:
+        keep(waiting, *last)
+    if last != None and last != (kept_x[-1], kept_y[-1]):
+        kept_x.append(last[0])
+        kept_y.append(last[1])
+
+    return np.array(kept_x), np.array(kept_y)
+
+def read_history(
+        points: int,
+        db_engine: Engine = engine,
+        batch: int = anal_params['plot_batch']
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """Read the total consumption of the whole history, downsampled.
+
+    The sums come from the database, streamed with a server side cursor
+    batch by batch straight into the downsampling.
+
+    Args:
+        points (int): max points to return
+        db_engine (Engine): Engine to read from
+        batch (int): rows fetched per round trip
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: timestamps and consumption in kW
+    """
+
+    with db_engine.connect() as conn:
+        queries, start, end = history_queries(conn)
+        if start == None:
+            return np.empty(0), np.empty(0)
+
+        def chunks() -> Iterator[np.ndarray]:
+            streaming: Connection = conn.execution_options(stream_results = True, yield_per = batch)
+            for query in queries:
+                for rows in streaming.execute(query).partitions():
+                    # np.array on Row objects probes every row for array attributes
+                    yield np.fromiter(chain.from_iterable(rows), np.float64, 2 * len(rows)).reshape(-1, 2)
+
+        return downsample(chunks(), start, end, points)
+
+def post_plot(
+        name: str = "graph_file.png",
+        dpi: int = 300,
+        points: Optional[int] = None,
+        db_engine: Engine = engine
+        ) -> bool:
+    """Plot the total consumption of the whole history.
+
+    Old ranges come from the rollups, see history_queries.
+
+    Args:
+        name (str): image file
+        dpi (int): image resolution
+        points (Optional[int]): points to plot, the image width in pixels if None
+        db_engine (Engine): Engine to read from
+
+    Returns:
+        bool: False if there is no data to plot
+    """
+
+    fig, ax = plt.subplots()
+    if points == None:
+        # more points than pixels do not show
+        points = int(fig.get_figwidth() * dpi)
+
+    timestamps, consumption = read_history(points, db_engine)
+    if len(timestamps) == 0:
+        plt.close(fig)
+        return False
+
+    ax.plot(timestamps, consumption, '-b')
+    ax.axhline(y_max_value, linestyle = '--', color = 'r')
+    ax.axhline(y_min_value, linestyle = '--', color = 'y')
+    ax.axhline(max_cap, linestyle = '--', color = 'm')
+    ax.set_title("Power Consumption")
+    ax.set_ylabel("kW")
+    ax.set_xlabel("Seconds")
+    fig.savefig(name, dpi = dpi)
+    plt.close(fig)
+    return True
+
+
+if __name__ == "__main__":
+    post_plot()
@@ -0,0 +1,240 @@
+# group_command.py
+
+# imports
+import logging
+import socket
+from time import monotonic, sleep
+from typing import Callable, Optional, Self
+from control_protocol import ControlPacket
+from connection_pool import HouseConnectionPool, control_params, pool
+from house_registry import HouseRegistry, registry
+from log_pipeline import limiter
+from metrics import metrics
+from state_store import LatestStateStore, store
+
+log = logging.getLogger(__name__)
+
+GROUP_SENT = metrics.counter('area_group_commands_total', 'Group command datagrams sent')
+GROUP_UNACKED = metrics.counter('area_group_unacked_total', 'Houses that did not acknowledge a group command')
+
+class GroupChannel():
+    """Sends control packets to the whole fleet in one UDP broadcast.
+
+    The packets carry a house selector, houses that are not selected
+    ignore them.
+    """
+
+    def __init__(
+            self: Self,
+            address: str = control_params['group_address'],
+            port: int = control_params['group_port']
+            ) -> None:
+        """Initialize the channel.
+
+        Args:
+            self (Self): self
+            address (str): broadcast or multicast address of the houses
+            port (int): group command port of the houses
+        """
+
+        self.address: str = address
+        self.port: int = port
+        self._sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+        # statistics
+        self.sent: int = 0
+        self.failures: int = 0
+
+    def send(self: Self, payload: bytes) -> bool:
+        """Send one packet to the group.
+
+        Args:
+            self (Self): self
+            payload (bytes): packet, with a house selector
+
+        Returns:
+            bool: True if the datagram was sent
+        """
+
+        try:
+            self._sock.sendto(payload, (self.address, self.port))
+        except OSError as e:
+            self.failures += 1
+            if limiter.allow('send_failed'):
+                log.warning("Group send to %s failed: %s", self.address, e)
+            return False
+
+        self.sent += 1
+        GROUP_SENT.inc()
+        return True
+
+    def stats(self: Self) -> dict[str, int]:
+        """Get the send statistics.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, int]: sent and failed datagrams
+        """
+
+        return {'sent': self.sent, 'failures': self.failures}
+
+def wait_for_acks(
+        expected: dict[int, bool],
+        devices: int,
+        timeout: float,
+        sent_after: dict[int, int],
+        state_store: LatestStateStore = store,
+        poll: float = control_params['ack_poll']
+        ) -> set[int]:
+    """Wait until the houses report the commanded device state.
+
+    A house acknowledges a command when a sample newer than the one it
+    had when the command was sent shows the commanded device state. A
+    sample from before the command does not count, even if it matches.
+
+    Args:
+        expected (dict[int, bool]): commanded state per house_id
+        devices (int): devices the command switched
+        timeout (float): seconds to wait
+        sent_after (dict[int, int]): timestamp of the latest sample per
+            house_id when the command was sent
+        state_store (LatestStateStore): latest telemetry per house
+        poll (float): seconds between checks
+
+    Returns:
+        set[int]: houses that did not acknowledge in time
+    """
+
+    pending: set[int] = set(expected)
+    end: float = monotonic() + timeout
+
+    while True:
+        for house_id in list(pending):
+            sample = state_store.get(house_id)
+            if sample != None and sample[3] > sent_after.get(house_id, -1) \
+                    and (sample[0] & devices > 0) == expected[house_id]:
+                pending.discard(house_id)
+
+        if not pending or monotonic() >= end:
+            return pending
+        sleep(poll)
+
+def dispatch(
+        switch_off: list[int],
+        switch_on: list[int],
+        devices: int = 1,
+        channel: Optional[GroupChannel] = None,
+        house_registry: HouseRegistry = registry,
+        connection_pool: HouseConnectionPool = pool,
+        state_store: LatestStateStore = store,
+        group_min_houses: int = control_params['group_min_houses'],
+        group_acks: bool = control_params['group_acks'],
+        ack_timeout: float = control_params['ack_timeout'],
+        deadline: float = control_params['command_deadline'],
+        on_late: Optional[Callable[[int, bool], None]] = None
+        ) -> tuple[list[int], list[int]]:
+    """Send the on and off commands of one decision.
+
+    A direction with at least group_min_houses houses goes out as one
+    group datagram, smaller ones over the per-house connections. With
+    group_acks the group commands are checked against the telemetry and
+    the houses that did not acknowledge get the command over their
+    connection.
+
+    Args:
+        switch_off (list[int]): houses to switch off
+        switch_on (list[int]): houses to switch on
+        devices (int): devices to switch
+        channel (Optional[GroupChannel]): group channel, the shared one if None
+        house_registry (HouseRegistry): house ips
+        connection_pool (HouseConnectionPool): per-house connections
+        state_store (LatestStateStore): latest telemetry per house, both
+            for the samples before the command and the acknowledgements
+        group_min_houses (int): min houses for a group command
+        group_acks (bool): check group commands and fall back to unicast
+        ack_timeout (float): seconds to wait for acknowledgements
+        deadline (float): seconds a unicast fan-out may take
+        on_late (Optional[Callable[[int, bool], None]]): called with the
+            house_id and the commanded state of every unicast command that
+            was delivered after the deadline
+
+    Returns:
+        tuple[list[int], list[int]]: houses switched off and houses switched on
+    """
+
+    if channel == None:
+        channel = group_channel
+
+    delivered: dict[bool, list[int]] = {False: [], True: []}
+    grouped: dict[int, bool] = {}
+    unicast: dict[int, bool] = {}
+
+    # only samples newer than these acknowledge a group command
+    sent_after: dict[int, int] = {}
+
+    for onoff, house_ids in ((False, switch_off), (True, switch_on)):
+        if len(house_ids) >= group_min_houses:
+            for house_id in house_ids:
+                sample = state_store.get(house_id)
+                if sample != None:
+                    sent_after[house_id] = sample[3]
+            packet = ControlPacket()
+            packet.add_devices(onoff, devices)
+            packet.add_selector(house_ids)
+            if channel.send(packet.get_packet()):
+                grouped.update((house_id, onoff) for house_id in house_ids)
+                continue
+        unicast.update((house_id, onoff) for house_id in house_ids)
+
+    def send_unicast(commands: dict[int, bool]) -> None:
+        payloads: dict[bool, bytes] = {}
+        for onoff in (False, True):
+            packet = ControlPacket()
+            packet.add_devices(onoff, devices)
+            payloads[onoff] = packet.get_packet()
+
+        targets: dict[str, int] = {}
+        for house_id in commands:
+            ip = house_registry.ip_of(house_id)
+            if ip == None:
+                if limiter.allow('no_ip'):
+                    log.warning("House %d does not have an ip", house_id)
+                continue
+            targets[ip] = house_id
+
+        def late(ip: str, sent: bool) -> None:
+            if sent and on_late != None:
+                on_late(targets[ip], commands[targets[ip]])
+
+        results = connection_pool.send_many(
+                {ip: payloads[commands[house_id]] for ip, house_id in targets.items()},
+                deadline,
+                late
+                )
+        for ip, house_id in targets.items():
+            if results[ip][0]:
+                delivered[commands[house_id]].append(house_id)
+
+    if unicast:
+        send_unicast(unicast)
+
+    if grouped:
+        unacked: set[int] = set()
+        if group_acks:
+            unacked = wait_for_acks(grouped, devices, ack_timeout, sent_after, state_store)
+        for house_id, onoff in grouped.items():
+            if house_id not in unacked:
+                delivered[onoff].append(house_id)
+        if unacked:
+            GROUP_UNACKED.inc(len(unacked))
+            if limiter.allow('unacked'):
+                log.warning("%d/%d houses did not acknowledge, sending directly", len(unacked), len(grouped))
+            send_unicast({house_id: grouped[house_id] for house_id in unacked})
+
+    return delivered[False], delivered[True]
+
+# process wide group channel
+group_channel = GroupChannel()
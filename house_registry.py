@@ -0,0 +1,153 @@
+# house_registry.py
+
+# imports
+import json
+import logging
+from threading import Thread, Lock
+from time import sleep, monotonic
+from typing import Optional, Self
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from log_pipeline import limiter
+from models import HousePool
+from utils import engine
+
+# read config
+with open('ingest_param.json', 'r') as fd:
+    ingest_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+class HouseRegistry():
+    """In-memory index of house_pool mapping source ip to house_id.
+
+    The index is loaded from the database and swapped in whole on every
+    reload, so lookups never take a lock.
+    """
+
+    def __init__(
+            self: Self,
+            refresh_interval: float = ingest_params['registry_refresh'],
+            db_engine: Engine = engine
+            ) -> None:
+        """Initialize the registry.
+
+        Args:
+            self (Self): self
+            refresh_interval (float): Seconds between periodic reloads,
+                also the minimum time between reloads caused by unknown ips
+            db_engine (Engine): Engine to load houses from
+        """
+
+        self.refresh_interval: float = refresh_interval
+        self._engine: Engine = db_engine
+        self._by_ip: dict[str, int] = {}
+        self._by_id: dict[int, str] = {}
+        self._last_load: float = 0
+        self._load_lock: Lock = Lock()
+
+        # senders that are not in house_pool, ip -> datagram count
+        self.unknown: dict[str, int] = {}
+
+    def load(self: Self) -> None:
+        """Reload all houses from house_pool.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        with self._load_lock:
+            with self._engine.connect() as conn:
+                rows = conn.execute(select(HousePool.id, HousePool.ip)).all()
+
+            self._by_ip = {ip: house_id for house_id, ip in rows}
+            self._by_id = {house_id: ip for house_id, ip in rows}
+            self._last_load = monotonic()
+
+    def lookup(self: Self, ip: str) -> Optional[int]:
+        """Get the house_id of a sender.
+
+        Unknown senders are counted and trigger a background reload,
+        at most once every refresh_interval.
+
+        Args:
+            self (Self): self
+            ip (str): source ip
+
+        Returns:
+            Optional[int]: house_id or None if the ip is unknown
+        """
+
+        house_id: Optional[int] = self._by_ip.get(ip)
+        if house_id != None:
+            return house_id
+
+        # the house might have been added since the last load,
+        # reload in the background so the caller never waits on the database
+        if monotonic() - self._last_load >= self.refresh_interval \
+                and not self._load_lock.locked():
+            self._last_load = monotonic()
+            Thread(target = self.reload, daemon = True).start()
+
+        if ip not in self.unknown and limiter.allow('unknown_sender'):
+            log.warning("Unknown sender %s", ip)
+        self.unknown[ip] = self.unknown.get(ip, 0) + 1
+        return None
+
+    def reload(self: Self) -> None:
+        """Reload all houses, reporting instead of raising on failure.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        try:
+            self.load()
+        except Exception as e:
+            log.error("House registry reload failed: %s", e)
+
+    def ip_of(self: Self, house_id: int) -> Optional[str]:
+        """Get the ip of a house.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+
+        Returns:
+            Optional[str]: ip or None if the house is unknown
+        """
+
+        return self._by_id.get(house_id)
+
+    def house_ids(self: Self) -> list[int]:
+        """Get the ids of all known houses.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            list[int]: house ids
+        """
+
+        return list(self._by_id)
+
+class RegistryRefresh(Thread):
+    """Periodically reloads a HouseRegistry."""
+
+    def __init__(self: Self, registry: HouseRegistry) -> None:
+        super().__init__(daemon = True)
+        self.registry: HouseRegistry = registry
+
+    def run(self: Self) -> None:
+        while True:
+            sleep(self.registry.refresh_interval)
+            self.registry.reload()
+
+# process wide registry
+registry = HouseRegistry()
@@ -0,0 +1,219 @@
+# house_state.py
+
+# imports
+import heapq
+import logging
+from threading import Lock
+from typing import Iterator, Optional, Self
+from sqlalchemy import select, func
+from sqlalchemy.engine import Engine
+from models import ActionPool
+from utils import engine
+
+log = logging.getLogger(__name__)
+
+# (sort key, house_id, version), the key is -temperature in the on heap
+HeapEntry = tuple[float, int, int]
+
+class HouseStateRegistry():
+    """On/off state of every house with temperature ordered candidates.
+
+    Switched off houses are kept in a set. The hottest on houses and the
+    coldest off houses are kept in two heaps. Heap entries are invalidated
+    lazily by a version per house, so a state or temperature change is one
+    push, and the heaps are rebuilt once half of their entries are stale.
+    """
+
+    def __init__(self: Self, db_engine: Engine = engine) -> None:
+        """Initialize the registry, every house starts switched on.
+
+        Args:
+            self (Self): self
+            db_engine (Engine): Engine to restore the state from
+        """
+
+        self._engine: Engine = db_engine
+        self._lock: Lock = Lock()
+        self._off: set[int] = set()
+        self._temperatures: dict[int, float] = {}
+        self._versions: dict[int, int] = {}
+        self._on_heap: list[HeapEntry] = []
+        self._off_heap: list[HeapEntry] = []
+
+    def load(self: Self) -> None:
+        """Restore the state from the latest action_pool row per house.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        latest = select(ActionPool.house_id, func.max(ActionPool.id).label('id')) \
+                .where(ActionPool.device == 1) \
+                .group_by(ActionPool.house_id) \
+                .subquery()
+
+        with self._engine.connect() as conn:
+            rows = conn.execute(
+                    select(ActionPool.house_id, ActionPool.state_change)
+                    .join(latest, ActionPool.id == latest.c.id)
+                    ).all()
+
+        with self._lock:
+            self._off = {house_id for house_id, state_change in rows if not state_change}
+            self._rebuild()
+
+        log.info("Restored house states, %d of %d houses off", len(self._off), len(rows))
+
+    def is_off(self: Self, house_id: int) -> bool:
+        """Check if a house is switched off.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+
+        Returns:
+            bool: True if the house is switched off
+        """
+
+        return house_id in self._off
+
+    def off_houses(self: Self) -> frozenset[int]:
+        """Get the switched off houses.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            frozenset[int]: house_ids
+        """
+
+        with self._lock:
+            return frozenset(self._off)
+
+    def temperature(self: Self, house_id: int) -> Optional[float]:
+        """Get the last observed temperature of a house.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+
+        Returns:
+            Optional[float]: temperature, None if never observed
+        """
+
+        return self._temperatures.get(house_id)
+
+    def set_state(self: Self, house_id: int, on: bool) -> None:
+        """Record that a house was switched.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+            on (bool): True if the house was switched on
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            if on:
+                self._off.discard(house_id)
+            else:
+                self._off.add(house_id)
+            self._push(house_id)
+
+    def observe(self: Self, house_data: list[tuple[int, float, float, int, int]]) -> None:
+        """Update the temperatures from the latest samples.
+
+        Args:
+            self (Self): self
+            house_data (list[tuple[int, float, float, int, int]]): latest sample per house
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            for sample in house_data:
+                if self._temperatures.get(sample[4]) != sample[2]:
+                    self._temperatures[sample[4]] = sample[2]
+                    self._push(sample[4])
+
+            # stale entries are dropped once they outnumber the live ones
+            if len(self._on_heap) + len(self._off_heap) > 2 * len(self._temperatures) + 64:
+                self._rebuild()
+
+    def hottest_on(self: Self) -> Iterator[int]:
+        """Iterate the switched on houses, hottest first.
+
+        Taking k houses costs O(n + k log n).
+
+        Args:
+            self (Self): self
+
+        Returns:
+            Iterator[int]: house_ids
+        """
+
+        with self._lock:
+            heap: list[HeapEntry] = list(self._on_heap)
+            versions: dict[int, int] = dict(self._versions)
+        return self._iterate(heap, versions)
+
+    def coldest_off(self: Self) -> Iterator[int]:
+        """Iterate the switched off houses, coldest first.
+
+        Taking k houses costs O(n + k log n).
+
+        Args:
+            self (Self): self
+
+        Returns:
+            Iterator[int]: house_ids
+        """
+
+        with self._lock:
+            heap: list[HeapEntry] = list(self._off_heap)
+            versions: dict[int, int] = dict(self._versions)
+        return self._iterate(heap, versions)
+
+    def _iterate(self: Self, heap: list[HeapEntry], versions: dict[int, int]) -> Iterator[int]:
+        while heap:
+            _, house_id, version = heapq.heappop(heap)
+            if versions.get(house_id) == version:
+                yield house_id
+
+    def _push(self: Self, house_id: int) -> None:
+        """Push the current entry of a house, caller holds the lock."""
+
+        version: int = self._versions.get(house_id, 0) + 1
+        self._versions[house_id] = version
+
+        temperature: Optional[float] = self._temperatures.get(house_id)
+        if temperature == None:
+            return
+
+        if house_id in self._off:
+            heapq.heappush(self._off_heap, (temperature, house_id, version))
+        else:
+            heapq.heappush(self._on_heap, (-temperature, house_id, version))
+
+    def _rebuild(self: Self) -> None:
+        """Rebuild both heaps from the live entries, caller holds the lock."""
+
+        self._on_heap = []
+        self._off_heap = []
+        for house_id, temperature in self._temperatures.items():
+            version: int = self._versions.setdefault(house_id, 0)
+            if house_id in self._off:
+                self._off_heap.append((temperature, house_id, version))
+            else:
+                self._on_heap.append((-temperature, house_id, version))
+        heapq.heapify(self._on_heap)
+        heapq.heapify(self._off_heap)
+
+# process wide house states
+house_states = HouseStateRegistry()
@@ -0,0 +1,180 @@
+# ingest_queue.py
+
+# imports
+from collections import deque
+from threading import Condition
+from time import monotonic
+from typing import Optional, Self
+from telemetry import Sample
+
+# overflow policies
+DROP_OLDEST: str = 'drop_oldest'
+DROP_NEWEST: str = 'drop_newest'
+LATEST_PER_HOUSE: str = 'latest_per_house'
+POLICIES: tuple[str, ...] = (DROP_OLDEST, DROP_NEWEST, LATEST_PER_HOUSE)
+
+class IngestQueue():
+    """Bounded queue between the receive and the persistence stage.
+
+    put never blocks. When the queue is full the overflow policy decides
+    what is lost:
+        drop_oldest: the oldest queued sample is dropped
+        drop_newest: the incoming sample is dropped
+        latest_per_house: the incoming sample replaces the queued sample of
+            the same house, or the oldest sample if the house has none queued
+    """
+
+    def __init__(self: Self, maxsize: int, policy: str = DROP_OLDEST) -> None:
+        """Initialize the queue.
+
+        Args:
+            self (Self): self
+            maxsize (int): max number of queued samples
+            policy (str): overflow policy
+
+        Raises:
+            ValueError: Unknown policy or maxsize below 1
+        """
+
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy}, use one of {POLICIES}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize: int = maxsize
+        self.policy: str = policy
+
+        # entries are one element lists so a queued sample can be replaced
+        self._entries: deque[list[Sample]] = deque()
+        self._by_house: dict[int, list[Sample]] = {}
+        self._cond: Condition = Condition()
+        self._closed: bool = False
+
+        # metrics
+        self.accepted: int = 0
+        self.dropped: int = 0
+        self.replaced: int = 0
+        self.high_water: int = 0
+
+    def __len__(self: Self) -> int:
+        return len(self._entries)
+
+    def put(self: Self, sample: Sample) -> bool:
+        """Queue a sample, applying the overflow policy when full.
+
+        Args:
+            self (Self): self
+            sample (Sample): sample to queue
+
+        Returns:
+            bool: False if the incoming sample was dropped
+        """
+
+        with self._cond:
+            if len(self._entries) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+
+                if self.policy == LATEST_PER_HOUSE:
+                    queued: Optional[list[Sample]] = self._by_house.get(sample[4])
+                    if queued != None:
+                        queued[0] = sample
+                        self.replaced += 1
+                        self.accepted += 1
+                        return True
+
+                self._pop_entry()
+                self.dropped += 1
+
+            entry: list[Sample] = [sample]
+            self._entries.append(entry)
+            if self.policy == LATEST_PER_HOUSE:
+                self._by_house[sample[4]] = entry
+
+            self.accepted += 1
+            self.high_water = max(self.high_water, len(self._entries))
+            self._cond.notify()
+            return True
+
+    def get_many(self: Self, max_items: int, timeout: Optional[float] = None) -> Optional[list[Sample]]:
+        """Take up to max_items samples, waiting for at least one.
+
+        Args:
+            self (Self): self
+            max_items (int): max number of samples to take
+            timeout (Optional[float]): max seconds to wait, None waits forever
+
+        Returns:
+            Optional[list[Sample]]: samples, empty on timeout,
+                None when the queue is closed and drained
+        """
+
+        with self._cond:
+            deadline: Optional[float] = None
+            if timeout != None:
+                deadline = monotonic() + timeout
+
+            while not self._entries and not self._closed:
+                remaining: Optional[float] = None
+                if deadline != None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return []
+                self._cond.wait(remaining)
+
+            if not self._entries:
+                return None
+
+            samples: list[Sample] = []
+            while self._entries and len(samples) < max_items:
+                samples.append(self._pop_entry()[0])
+            return samples
+
+    def close(self: Self) -> None:
+        """Wake up the consumer, get_many returns None once drained.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self: Self) -> dict[str, int]:
+        """Get the queue metrics.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, int]: metrics
+        """
+
+        return {
+                'depth': len(self._entries),
+                'maxsize': self.maxsize,
+                'high_water': self.high_water,
+                'accepted': self.accepted,
+                'dropped': self.dropped,
+                'replaced': self.replaced
+                }
+
+    def _pop_entry(self: Self) -> list[Sample]:
+        """Remove the oldest entry, caller holds the lock.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            list[Sample]: the removed entry
+        """
+
+        entry: list[Sample] = self._entries.popleft()
+        if self._by_house.get(entry[0][4]) is entry:
+            del self._by_house[entry[0][4]]
+        return entry
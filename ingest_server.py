@@ -0,0 +1,193 @@
+# ingest_server.py
+
+# imports
+import asyncio
+import json
+import logging
+import socket
+from typing import Callable, Optional, Self
+from db_writer import BatchWriter
+from house_registry import HouseRegistry, registry
+from log_pipeline import limiter
+from metrics import metrics
+from telemetry import decode_batch, Sample
+
+# read config
+with open('ingest_param.json', 'r') as fd:
+    ingest_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+# larger than any datagram, longer ones are truncated and rejected by size
+RECV_SIZE: int = 2048
+
+DECODE_LATENCY = metrics.histogram('area_ingest_decode_seconds', 'Time to decode one batch of datagrams')
+
+def make_socket(
+        port: int = ingest_params['port'],
+        rcvbuf: int = ingest_params['rcvbuf'],
+        reuse_port: bool = False
+        ) -> socket.socket:
+    """Creates the bound udp socket for telemetry.
+
+    Args:
+        port (int): port to listen on
+        rcvbuf (int): requested SO_RCVBUF in bytes, 0 keeps the os default
+        reuse_port (bool): set SO_REUSEPORT so several processes can bind
+            the port and the kernel spreads the senders between them
+
+    Returns:
+        socket.socket: bound non-blocking socket
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf > 0:
+        # the kernel caps this at net.core.rmem_max
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind(("", port))
+    sock.setblocking(False)
+    return sock
+
+class TelemetryProtocol():
+    """Decodes telemetry datagrams and hands them to the batch writer.
+
+    Nothing in here waits on the database, the writer queue is the
+    boundary between the event loop and the persistence layer.
+    """
+
+    def __init__(
+            self: Self,
+            writer: BatchWriter,
+            house_registry: HouseRegistry = registry,
+            on_sample: Optional[Callable[[Sample], None]] = None,
+            read_batch: int = ingest_params['read_batch']
+            ) -> None:
+        """Initialize the protocol.
+
+        Args:
+            self (Self): self
+            writer (BatchWriter): writer to hand samples to
+            house_registry (HouseRegistry): registry to resolve senders
+            on_sample (Optional[Callable[[Sample], None]]): called with every
+                accepted sample, must not block
+            read_batch (int): max datagrams read from the socket in one go
+        """
+
+        self.writer: BatchWriter = writer
+        self.registry: HouseRegistry = house_registry
+        self.on_sample: Optional[Callable[[Sample], None]] = on_sample
+        self.read_batch: int = read_batch
+
+        # datagram counters
+        self.received: int = 0
+        self.decoded: int = 0
+        self.dropped: int = 0
+        self.batches: int = 0
+
+    def read(self: Self, sock: socket.socket) -> None:
+        """Drain the socket and handle what it held as one batch.
+
+        Called by the event loop when the socket is readable. Reads until
+        the socket is empty or read_batch datagrams were read, so a flood
+        does not starve the other callbacks of the loop.
+
+        Args:
+            self (Self): self
+            sock (socket.socket): bound non-blocking socket
+
+        Returns:
+            None:
+        """
+
+        datagrams: list[tuple[bytes, tuple[str, int]]] = []
+        recvfrom = sock.recvfrom
+        try:
+            for _ in range(self.read_batch):
+                datagrams.append(recvfrom(RECV_SIZE))
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            if limiter.allow('socket_error'):
+                log.warning("Telemetry socket error: %s", e)
+
+        if datagrams:
+            self.handle(datagrams)
+
+    def handle(self: Self, datagrams: list[tuple[bytes, tuple[str, int]]]) -> None:
+        """Decode and hand off a batch of datagrams.
+
+        Args:
+            self (Self): self
+            datagrams (list[tuple[bytes, tuple[str, int]]]): (payload, sender) pairs
+
+        Returns:
+            None:
+        """
+
+        self.received += len(datagrams)
+        self.batches += 1
+
+        #unpack messages
+        with DECODE_LATENCY.time():
+            records, rejected = decode_batch(datagrams)
+        self.dropped += rejected
+        self.decoded += len(records)
+
+        for record, addr in records:
+            if limiter.allow('telemetry'):
+                log.info("Received from %s: %s %s %s %s", addr, *record)
+
+            #find correct house in registry
+            house_id: Optional[int] = self.registry.lookup(addr[0])
+            if house_id == None:
+                self.dropped += 1
+                continue
+
+            #queue data entry for the batch writer
+            sample: Sample = record + (house_id,)
+            self.writer.submit(sample)
+
+            if self.on_sample != None:
+                self.on_sample(sample)
+
+    def stats(self: Self) -> dict[str, int]:
+        """Get the datagram counters.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, int]: counters
+        """
+
+        return {
+                'received': self.received,
+                'decoded': self.decoded,
+                'dropped': self.dropped,
+                'batches': self.batches
+                }
+
+async def serve(protocol: TelemetryProtocol, sock: Optional[socket.socket] = None) -> None:
+    """Runs the telemetry server until cancelled.
+
+    Args:
+        protocol (TelemetryProtocol): protocol handling the datagrams
+        sock (Optional[socket.socket]): bound socket, made from config if None
+
+    Returns:
+        None:
+    """
+
+    if sock == None:
+        sock = make_socket()
+
+    loop = asyncio.get_running_loop()
+    loop.add_reader(sock.fileno(), protocol.read, sock)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        loop.remove_reader(sock.fileno())
+        sock.close()
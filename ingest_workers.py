@@ -0,0 +1,205 @@
+# ingest_workers.py
+
+# imports
+import asyncio
+import json
+import signal
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import Connection, wait
+from threading import Thread, Lock
+from typing import Callable, Optional, Self
+from db_writer import BatchWriter
+from house_registry import registry, RegistryRefresh
+from ingest_server import TelemetryProtocol, make_socket, serve
+from log_pipeline import setup_logging
+from telemetry import Sample
+from utils import engine
+
+# read config
+with open('ingest_param.json', 'r') as fd:
+    ingest_params: dict = json.load(fd)
+
+# message from a worker: (datagram counters, house_id -> latest sample)
+StateMessage = tuple[dict[str, int], dict[int, Sample]]
+
+class IngestWorker(Process):
+    """Ingest process sharing the telemetry port through SO_REUSEPORT.
+
+    Each worker decodes and persists its share of the traffic, and
+    forwards the latest sample per house to the control process
+    every forward_interval seconds.
+    """
+
+    def __init__(
+            self: Self,
+            conn: Connection,
+            forward_interval: float = ingest_params['forward_interval']
+            ) -> None:
+        """Initialize the worker.
+
+        Args:
+            self (Self): self
+            conn (Connection): sending end of the pipe to the control process
+            forward_interval (float): seconds between state forwards
+        """
+
+        super().__init__(daemon = True)
+        self._conn: Connection = conn
+        self.forward_interval: float = forward_interval
+        self._latest: dict[int, Sample] = {}
+
+    def run(self: Self) -> None:
+        # connections inherited from the parent must not be reused
+        engine.dispose(close = False)
+
+        # the log writer thread of the parent does not survive the fork
+        setup_logging()
+
+        registry.load()
+        RegistryRefresh(registry).start()
+
+        writer = BatchWriter()
+        writer.start()
+
+        protocol = TelemetryProtocol(writer, on_sample = self._remember)
+
+        try:
+            asyncio.run(self._serve(protocol))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            writer.close()
+
+    def _remember(self: Self, sample: Sample) -> None:
+        self._latest[sample[4]] = sample
+
+    async def _serve(self: Self, protocol: TelemetryProtocol) -> None:
+        """Serve telemetry and forward state until SIGTERM.
+
+        Args:
+            self (Self): self
+            protocol (TelemetryProtocol): protocol handling the datagrams
+
+        Returns:
+            None:
+        """
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+        def forward() -> None:
+            if self._latest:
+                self._conn.send((protocol.stats(), self._latest))
+                self._latest = {}
+            loop.call_later(self.forward_interval, forward)
+
+        loop.call_later(self.forward_interval, forward)
+        await serve(protocol, make_socket(reuse_port = True))
+
+class StateReceiver(Thread):
+    """Collects the state forwarded by the ingest workers."""
+
+    def __init__(
+            self: Self,
+            conns: list[Connection],
+            on_state: Optional[Callable[[dict[int, Sample]], None]] = None
+            ) -> None:
+        """Initialize the receiver.
+
+        Args:
+            self (Self): self
+            conns (list[Connection]): receiving ends of the worker pipes
+            on_state (Optional[Callable[[dict[int, Sample]], None]]): called
+                with every forwarded house_id -> sample update
+        """
+
+        super().__init__(daemon = True)
+        self._conns: list[Connection] = conns
+        self.on_state: Optional[Callable[[dict[int, Sample]], None]] = on_state
+        self._lock: Lock = Lock()
+
+        # latest sample per house and datagram counters per worker
+        self.latest: dict[int, Sample] = {}
+        self.worker_stats: dict[int, dict[str, int]] = {}
+
+    def run(self: Self) -> None:
+        conns: list[Connection] = list(self._conns)
+        while conns:
+            for conn in wait(conns):
+                try:
+                    message: StateMessage = conn.recv()
+                except EOFError:
+                    conns.remove(conn)
+                    continue
+
+                stats, latest = message
+                with self._lock:
+                    self.worker_stats[self._conns.index(conn)] = stats
+                    self.latest.update(latest)
+
+                if self.on_state != None:
+                    self.on_state(latest)
+
+    def stats(self: Self) -> dict[str, int]:
+        """Get the datagram counters summed over all workers.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, int]: counters
+        """
+
+        total: dict[str, int] = {'received': 0, 'decoded': 0, 'dropped': 0, 'batches': 0}
+        with self._lock:
+            for stats in self.worker_stats.values():
+                for key in total:
+                    total[key] += stats[key]
+        return total
+
+def start_workers(
+        workers: int = ingest_params['workers'],
+        on_state: Optional[Callable[[dict[int, Sample]], None]] = None
+        ) -> tuple[list[IngestWorker], StateReceiver]:
+    """Starts the ingest worker processes.
+
+    Should be called before other threads are started, as the workers are forked.
+
+    Args:
+        workers (int): number of worker processes
+        on_state (Optional[Callable[[dict[int, Sample]], None]]): called
+            with every forwarded house_id -> sample update
+
+    Returns:
+        tuple[list[IngestWorker], StateReceiver]: workers and the receiver
+            collecting their state
+    """
+
+    processes: list[IngestWorker] = []
+    conns: list[Connection] = []
+    for _ in range(workers):
+        recv_conn, send_conn = Pipe(duplex = False)
+        process = IngestWorker(send_conn)
+        process.start()
+        send_conn.close()
+        processes.append(process)
+        conns.append(recv_conn)
+
+    receiver = StateReceiver(conns, on_state)
+    receiver.start()
+    return processes, receiver
+
+def stop_workers(processes: list[IngestWorker]) -> None:
+    """Stops the ingest workers, letting them flush their writers.
+
+    Args:
+        processes (list[IngestWorker]): workers to stop
+
+    Returns:
+        None:
+    """
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
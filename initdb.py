@@ -1,18 +1,66 @@
 # initdb.py
 
+from sqlalchemy import select, func
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from models import Base, HousePool
+from retention import setup_partitioning
 from utils import engine
 
 
+def migrate(db_engine: Engine = engine) -> None:
+    """Creates missing tables and indexes.
+
+    create_all only adds indexes together with new tables,
+    so indexes of existing tables are created one by one.
+    On PostgreSQL hd_data is made a partitioned table, see retention.py.
+
+    Args:
+        db_engine (Engine): Engine to migrate
+
+    Returns:
+        None:
+
+    Raises:
+        ValueError: house_pool has duplicate ips, the unique index cannot be made
+    """
+
+    if db_engine.dialect.name == 'postgresql':
+        # house_pool has to exist before the partitioned hd_data references it
+        Base.metadata.create_all(db_engine, tables=[
+            table for table in Base.metadata.sorted_tables if table.name != 'hd_data'
+            ])
+        setup_partitioning(db_engine)
+
+    Base.metadata.create_all(db_engine)
+
+    with db_engine.connect() as conn:
+        duplicates = conn.execute(
+                select(HousePool.ip).group_by(HousePool.ip).having(func.count() > 1)
+                ).scalars().all()
+
+    if duplicates:
+        raise ValueError(f"Duplicate ips in house_pool, remove them first: {duplicates}")
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db_engine, checkfirst=True)
+
+
 if __name__ == "__main__":
-    Base.metadata.create_all(engine)
+    migrate()
+
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    # only add the houses that are not there yet
+    known = set(session.scalars(select(HousePool.ip)))
 
     houses = []
     for i in range(3):
-        houses.append(HousePool(name = f"House {i+1}", ip = f"10.10.0.10{i+1}"))
+        ip = f"10.10.0.10{i+1}"
+        if ip not in known:
+            houses.append(HousePool(name = f"House {i+1}", ip = ip))
 
-    Session = sessionmaker(bind=engine)
-    session = Session()
     session.add_all(houses)
     session.commit()
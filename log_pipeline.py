@@ -0,0 +1,211 @@
+# log_pipeline.py
+
+# imports
+import atexit
+import json
+import logging
+import os
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Thread, Lock
+from time import monotonic, sleep
+from typing import Optional, Self
+
+PARAM_FILE: str = 'log_param.json'
+
+# read config
+with open(PARAM_FILE, 'r') as fd:
+    log_params: dict = json.load(fd)
+
+class EventLimiter():
+    """Decides which occurrences of a frequent event get logged.
+
+    Every event name has a sample rate (log 1 in N occurrences) and a rate
+    limit (max lines per second, as a token bucket). Both are checked
+    before a log record is made, so a suppressed occurrence costs a dict
+    lookup and a few adds. Suppressed occurrences are counted and reported
+    as one line per event every report interval.
+    """
+
+    def __init__(self: Self, sample: dict[str, int], rate_limit: dict[str, float]) -> None:
+        """Initialize the limiter.
+
+        Args:
+            self (Self): self
+            sample (dict[str, int]): 1 in N occurrences logged per event
+            rate_limit (dict[str, float]): max lines per second per event,
+                'default' for the events that are not listed
+        """
+
+        self._lock: Lock = Lock()
+        self._seen: dict[str, int] = {}
+        self._suppressed: dict[str, int] = {}
+        self._tokens: dict[str, float] = {}
+        self._last_refill: dict[str, float] = {}
+        self.configure(sample, rate_limit)
+
+    def configure(self: Self, sample: dict[str, int], rate_limit: dict[str, float]) -> None:
+        """Replace the sample rates and rate limits.
+
+        Args:
+            self (Self): self
+            sample (dict[str, int]): 1 in N occurrences logged per event
+            rate_limit (dict[str, float]): max lines per second per event
+
+        Returns:
+            None:
+        """
+
+        self.sample: dict[str, int] = dict(sample)
+        self.rate_limit: dict[str, float] = dict(rate_limit)
+
+    def allow(self: Self, event: str) -> bool:
+        """Check if this occurrence of an event should be logged.
+
+        Args:
+            self (Self): self
+            event (str): event name
+
+        Returns:
+            bool: True to log it
+        """
+
+        with self._lock:
+            seen: int = self._seen.get(event, 0) + 1
+            self._seen[event] = seen
+
+            if seen % self.sample.get(event, 1) != 0:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False
+
+            limit: float = self.rate_limit.get(event, self.rate_limit.get('default', 0))
+            if limit <= 0:
+                return True
+
+            now: float = monotonic()
+            tokens: float = min(
+                    self._tokens.get(event, limit) + (now - self._last_refill.get(event, now)) * limit,
+                    limit
+                    )
+            self._last_refill[event] = now
+            if tokens < 1:
+                self._tokens[event] = tokens
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False
+
+            self._tokens[event] = tokens - 1
+            return True
+
+    def take_suppressed(self: Self) -> dict[str, int]:
+        """Get and reset the suppressed counts.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            dict[str, int]: suppressed occurrences per event since the last call
+        """
+
+        with self._lock:
+            suppressed: dict[str, int] = self._suppressed
+            self._suppressed = {}
+        return suppressed
+
+class LogMaintenance(Thread):
+    """Reports suppressed events and reloads the config when it changes."""
+
+    def __init__(
+            self: Self,
+            report_interval: float = log_params['report_interval'],
+            path: str = PARAM_FILE
+            ) -> None:
+        super().__init__(daemon = True)
+        self.report_interval: float = report_interval
+        self.path: str = path
+        self._mtime: float = os.stat(path).st_mtime
+
+    def run(self: Self) -> None:
+        log: logging.Logger = logging.getLogger('log_pipeline')
+        while True:
+            sleep(self.report_interval)
+
+            for event, count in sorted(limiter.take_suppressed().items()):
+                log.info("%s: %d lines suppressed in the last %.0f s", event, count, self.report_interval)
+
+            try:
+                mtime: float = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    self._mtime = mtime
+                    with open(self.path, 'r') as fd:
+                        params: dict = json.load(fd)
+                    apply_params(params)
+                    log.info("Reloaded %s", self.path)
+            except (OSError, ValueError, KeyError) as e:
+                log.warning("Reloading %s failed: %s", self.path, e)
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted, the listener thread formats them.
+
+    The records never leave the process, so the message arguments do not
+    have to be rendered or made picklable first. Arguments must not be
+    changed after they were logged.
+    """
+
+    def prepare(self: Self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def apply_params(params: dict) -> None:
+    """Apply a log config, used at startup and on reload.
+
+    Args:
+        params (dict): log_param.json content
+
+    Returns:
+        None:
+    """
+
+    logging.getLogger().setLevel(params['level'])
+    limiter.configure(params['sample'], params['rate_limit'])
+
+# pid of the process the pipeline was set up in, forked workers set up their own
+_setup_pid: Optional[int] = None
+
+def setup_logging(params: dict = log_params) -> None:
+    """Route all logging through a queue to a background writer thread.
+
+    Callers only put records on an unbounded queue, formatting of the
+    line and the write to stdout happen on the listener thread. Safe to
+    call again, and needed again after a fork.
+
+    Args:
+        params (dict): log config
+
+    Returns:
+        None:
+    """
+
+    global _setup_pid
+
+    if _setup_pid == os.getpid():
+        return
+    _setup_pid = os.getpid()
+
+    records: SimpleQueue = SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(params['format']))
+
+    root: logging.Logger = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    apply_params(params)
+
+    listener = QueueListener(records, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    LogMaintenance().start()
+
+# process wide limiter
+limiter = EventLimiter(log_params['sample'], log_params['rate_limit'])
@@ -1,82 +1,69 @@
 # main.py
 
 # Imports
-import socket
-import struct
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import json
+import logging
+from log_pipeline import setup_logging
+from db_writer import BatchWriter
+from house_registry import registry, RegistryRefresh
+from ingest_server import TelemetryProtocol, serve
+from ingest_workers import start_workers, stop_workers
+from state_store import store
+from rolling_stats import rolling
+from metrics import metrics, stats_collector, MetricsServer
+from connection_pool import pool
+from house_state import house_states
+from retention import StorageMaintenance
 from utils import engine
-from models import HousePool, HDData
 from start_protocol import onoff_houses
 from threading import Thread
-from time import sleep
+from time import sleep, time
 import atexit
 
-from data_analysis import param_check, send_command
+from data_analysis import send_command
 from clk_sync import clk_sync
-from graph_dev import animate, live_graph
+from graph_dev import LiveGraph
 
-class RecvUnpack(Thread):
-    def run(self):
-        #variables
-        PORT = 42070
-        ADDR = ""
-
-        #setup database session
-        Session = sessionmaker(bind = engine)
-        session = Session()
-
-        #setup socket udp server
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind((ADDR, PORT))
+# read config
+with open('ingest_param.json', 'r') as fd:
+    ingest_params: dict = json.load(fd)
 
-        #listen for incoming messages
-        while True:
-            byte_message = sock.recvfrom(1024)
-            data, house_addr = byte_message
+with open('anal_param.json', 'r') as fd:
+    anal_params: dict = json.load(fd)
 
-            #unpack message
-            device_state: int = data[0]
-            power_usage: float = struct.unpack(">f", data[1:5])[0]
-            temperature: float = struct.unpack(">f", data[5:9])[0]
-            unix_timestamp: int = int.from_bytes(data[9:13], 'big')
+log = logging.getLogger('main')
 
-            print(f"Received from {house_addr}: {device_state} {power_usage} {temperature} {unix_timestamp}")
+#every sample updates the latest state and the rolling statistics
+def on_sample(sample):
+    store.update(sample)
+    rolling.update(sample)
+    rolling.update_area(store.total_consumption(), time())
 
-            #find correct house in database
-            house_id = session.query(HousePool).filter(
-                    HousePool.ip == house_addr[0]
-                    ).first().id
+def on_state(latest):
+    store.update_many(latest.values())
+    rolling.update_many(latest.values())
+    rolling.update_area(store.total_consumption(), time())
 
-            #create data entry
-            entry = HDData(device_state = device_state,
-                        power_usage = power_usage,
-                        temperature = temperature,
-                        timestamp = unix_timestamp,
-                        house_id = house_id)
+class RecvUnpack(Thread):
+    def __init__(self, writer: BatchWriter):
+        super().__init__()
+        self.protocol = TelemetryProtocol(writer, on_sample = on_sample)
 
-            #commit data
-            session.add(entry)
-            session.commit()
+    def run(self):
+        asyncio.run(serve(self.protocol))
 
 class SendCommand(Thread):
     def run(self):
-        off_list = []
         while True:
-            sleep(1)
+            #decide as soon as the consumption changes,
+            #with a periodic tick as fallback
+            store.wait_for_change(anal_params['fallback_tick'],
+                                  anal_params['debounce'])
             try:
-                command = send_command(off_list)
-                if command == None:
-                    continue
-                if type(command[1]) == int:
-                    off_list.append(command[1])
-                    off_list.remove(command[0])
-                elif command[1] and len(off_list) > 0:
-                    off_list.remove(command[0])
-                elif not command[1]:
-                    off_list.append(command[0])
+                send_command()
             except Exception as e:
-                print("Crashed")
-                print(e)
+                log.exception("Crashed: %s", e)
 
 class SendClkSync(Thread):
     def run(self):
@@ -87,11 +74,60 @@ class SendClkSync(Thread):
 onoff_houses(on_off = True)
 atexit.register(onoff_houses)
 
-recv_unpack = RecvUnpack()
-recv_unpack.start()
+if ingest_params['workers'] > 0:
+    #multi-process ingest, workers are forked before any thread is started
+    ingest_workers, state_receiver = start_workers(on_state = on_state)
+    atexit.register(stop_workers, ingest_workers)
+    metrics.collector(stats_collector('area_ingest', state_receiver.stats))
+
+#all logging goes through a queue, written by a background thread,
+#started after the workers are forked so they inherit no running threads
+setup_logging()
+
+registry.load()
+registry_refresh = RegistryRefresh(registry)
+registry_refresh.start()
+
+#prometheus endpoint, gauges are read from the components on scrape
+metrics.collector(lambda: [
+    ('area_store_houses', 'Houses in the latest-state store', len(store)),
+    ('area_store_consumption', 'Total consumption of the latest samples in kW', store.total_consumption()),
+    ('area_unknown_senders', 'Telemetry senders that are not in house_pool', len(registry.unknown)),
+    ('area_connections_open', 'Open control connections', sum(
+        1 for stats in pool.stats().values() if stats['connected']))
+    ])
+metrics_server = MetricsServer()
+metrics_server.start()
+
+#restore which houses are switched off from the action pool
+house_states.load()
+
+#warm the latest-state store, the control loop only reads from memory
+store.warm()
+
+if ingest_params['workers'] == 0:
+    batch_writer = BatchWriter()
+    batch_writer.start()
+    atexit.register(batch_writer.close)
+
+    recv_unpack = RecvUnpack(batch_writer)
+    recv_unpack.start()
+
+    metrics.collector(stats_collector('area_ingest', recv_unpack.protocol.stats))
+    metrics.collector(stats_collector('area_writer', batch_writer.stats))
+
+if engine.dialect.name == 'postgresql':
+    #partitions, rollups and retention of hd_data
+    storage_maintenance = StorageMaintenance()
+    storage_maintenance.start()
 
 sendcommand = SendCommand()
 sendcommand.start()
 
 send_clk_sync = SendClkSync()
 send_clk_sync.start()
+
+if anal_params['live_graph']:
+    #live consumption plot from the state store, redrawn in place
+    live_graph = LiveGraph()
+    live_graph.start()
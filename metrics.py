@@ -0,0 +1,262 @@
+# metrics.py
+
+# imports
+import json
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from time import perf_counter
+from typing import Callable, Optional, Self
+
+# read config
+with open('metrics_param.json', 'r') as fd:
+    metrics_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+# latency buckets in seconds, 100 us to 10 s
+LATENCY_BUCKETS: tuple[float, ...] = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+        0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+        )
+
+# (name, help, value) of a gauge read from existing statistics
+Gauge = tuple[str, str, float]
+
+class Counter():
+    """Monotonic counter."""
+
+    def __init__(self: Self, name: str, help: str) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.value: float = 0
+        self._lock: Lock = Lock()
+
+    def inc(self: Self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self: Self) -> list[str]:
+        return [
+                f"# HELP {self.name} {self.help}",
+                f"# TYPE {self.name} counter",
+                f"{self.name} {self.value}"
+                ]
+
+class Histogram():
+    """Histogram with fixed buckets, observe is a bisect and three adds."""
+
+    def __init__(
+            self: Self,
+            name: str,
+            help: str,
+            buckets: tuple[float, ...] = LATENCY_BUCKETS
+            ) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.buckets: tuple[float, ...] = buckets
+        self._counts: list[int] = [0] * (len(buckets) + 1)
+        self._sum: float = 0
+        self._count: int = 0
+        self._lock: Lock = Lock()
+
+    def observe(self: Self, value: float) -> None:
+        index: int = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self: Self) -> 'Timer':
+        """Time a block with the histogram.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            Timer: context manager observing the elapsed seconds
+        """
+
+        return Timer(self)
+
+    def render(self: Self) -> list[str]:
+        with self._lock:
+            counts: list[int] = list(self._counts)
+            total: float = self._sum
+            count: int = self._count
+
+        lines: list[str] = [
+                f"# HELP {self.name} {self.help}",
+                f"# TYPE {self.name} histogram"
+                ]
+        cumulative: int = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+class Timer():
+    """Context manager observing the seconds its block took."""
+
+    def __init__(self: Self, histogram: Histogram) -> None:
+        self.histogram: Histogram = histogram
+        self.start: float = 0
+
+    def __enter__(self: Self) -> Self:
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self: Self, *exc) -> None:
+        self.histogram.observe(perf_counter() - self.start)
+
+class MetricsRegistry():
+    """Process wide counters, histograms and gauge collectors.
+
+    Counters and histograms are updated on the hot path. Gauges come from
+    collectors that read the existing stats() of the components when the
+    metrics are scraped, so they cost nothing in between.
+    """
+
+    def __init__(self: Self) -> None:
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._collectors: list[Callable[[], list[Gauge]]] = []
+        self._lock: Lock = Lock()
+
+    def counter(self: Self, name: str, help: str) -> Counter:
+        """Get or create a counter.
+
+        Args:
+            self (Self): self
+            name (str): metric name, ending in _total
+            help (str): description
+
+        Returns:
+            Counter: counter
+        """
+
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help)
+            return self._metrics[name]
+
+    def histogram(self: Self, name: str, help: str) -> Histogram:
+        """Get or create a latency histogram.
+
+        Args:
+            self (Self): self
+            name (str): metric name, ending in _seconds
+            help (str): description
+
+        Returns:
+            Histogram: histogram
+        """
+
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help)
+            return self._metrics[name]
+
+    def collector(self: Self, collect: Callable[[], list[Gauge]]) -> None:
+        """Add a gauge collector, called on every scrape.
+
+        Args:
+            self (Self): self
+            collect (Callable[[], list[Gauge]]): returns the current gauges
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self: Self) -> str:
+        """Render all metrics in the Prometheus text format.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            str: exposition text
+        """
+
+        with self._lock:
+            metrics: list[Counter | Histogram] = list(self._metrics.values())
+            collectors: list[Callable[[], list[Gauge]]] = list(self._collectors)
+
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        for collect in collectors:
+            try:
+                gauges: list[Gauge] = collect()
+            except Exception as e:
+                log.exception("Metrics collector failed: %s", e)
+                continue
+            for name, help, value in gauges:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+
+        return "\n".join(lines) + "\n"
+
+def stats_collector(prefix: str, stats: Callable[[], dict]) -> Callable[[], list[Gauge]]:
+    """Make a collector exporting every value of a stats() dict as a gauge.
+
+    Args:
+        prefix (str): metric name prefix
+        stats (Callable[[], dict]): stats() of a component
+
+    Returns:
+        Callable[[], list[Gauge]]: collector
+    """
+
+    def collect() -> list[Gauge]:
+        return [(f"{prefix}_{key}", f"{key} of {prefix}", value)
+                for key, value in stats().items()]
+    return collect
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves GET /metrics."""
+
+    registry: MetricsRegistry
+
+    def do_GET(self: Self) -> None:
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+
+        body: bytes = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self: Self, format: str, *args) -> None:
+        # scrapes are not worth a line each
+        pass
+
+class MetricsServer(Thread):
+    """HTTP endpoint for the metrics, local only by default."""
+
+    def __init__(
+            self: Self,
+            registry: Optional[MetricsRegistry] = None,
+            address: str = metrics_params['address'],
+            port: int = metrics_params['port']
+            ) -> None:
+        super().__init__(daemon = True)
+        handler = type('Handler', (MetricsHandler,), {'registry': registry or metrics})
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer((address, port), handler)
+
+    def run(self: Self) -> None:
+        self.server.serve_forever()
+
+# process wide metrics
+metrics = MetricsRegistry()
@@ -1,6 +1,6 @@
 # models.py
 
-from sqlalchemy import String, Integer, Float, ForeignKey, Boolean
+from sqlalchemy import String, Integer, Float, ForeignKey, Boolean, Index
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column
 
 Base = declarative_base()
@@ -10,8 +10,10 @@ class HousePool(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(30))
-    ip: Mapped[str] = mapped_column(String(30))
+    ip: Mapped[str] = mapped_column(String(30), unique=True, index=True)
 
+# On PostgreSQL hd_data is range partitioned by timestamp,
+# with (id, timestamp) as primary key, see retention.py
 class HDData(Base):
     __tablename__ = "hd_data"
 
@@ -22,6 +24,9 @@ class HDData(Base):
     timestamp: Mapped[int] = mapped_column(Integer())
     house_id: Mapped[int] = mapped_column(ForeignKey("house_pool.id"))
 
+# latest sample per house is an index lookup instead of a table scan
+Index("ix_hd_data_house_id_timestamp", HDData.house_id, HDData.timestamp.desc())
+
 class ActionPool(Base):
     __tablename__ = "action_pool"
 
@@ -30,3 +35,32 @@ class ActionPool(Base):
     device: Mapped[int] = mapped_column(Integer())
     state_change: Mapped[bool] = mapped_column(Boolean())
     house_id: Mapped[int] = mapped_column(ForeignKey("house_pool.id"))
+
+# latest action per house restores the on/off state at startup
+Index("ix_action_pool_house_id_id", ActionPool.house_id, ActionPool.id)
+
+class RollupColumns:
+    """Columns shared by the hd_data rollup tables."""
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    bucket: Mapped[int] = mapped_column(Integer())
+    house_id: Mapped[int] = mapped_column(ForeignKey("house_pool.id"))
+    samples: Mapped[int] = mapped_column(Integer())
+    min_power: Mapped[float] = mapped_column(Float())
+    max_power: Mapped[float] = mapped_column(Float())
+    mean_power: Mapped[float] = mapped_column(Float())
+    min_temperature: Mapped[float] = mapped_column(Float())
+    max_temperature: Mapped[float] = mapped_column(Float())
+    mean_temperature: Mapped[float] = mapped_column(Float())
+    device_state: Mapped[int] = mapped_column(Integer())
+
+class HDRollup1m(RollupColumns, Base):
+    __tablename__ = "hd_rollup_1m"
+
+class HDRollup1h(RollupColumns, Base):
+    __tablename__ = "hd_rollup_1h"
+
+Index("ix_hd_rollup_1m_house_id_bucket", HDRollup1m.house_id, HDRollup1m.bucket, unique=True)
+Index("ix_hd_rollup_1h_house_id_bucket", HDRollup1h.house_id, HDRollup1h.bucket, unique=True)
+Index("ix_hd_rollup_1m_bucket", HDRollup1m.bucket)
+Index("ix_hd_rollup_1h_bucket", HDRollup1h.bucket)
@@ -0,0 +1,121 @@
+# param_oracle.py
+
+# imports
+import json
+import logging
+import os
+from threading import Lock
+from time import monotonic
+from typing import Optional, Self, Union
+
+# read config
+with open('control_param.json', 'r') as fd:
+    control_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+# (id, name, type)
+ParamSpec = tuple[int, str, str]
+
+class ParamOracle():
+    """Process wide index of the control parameters in param_oracle.json.
+
+    The parameters are indexed by name and by id and both indexes are
+    swapped in whole on every reload, so lookups never take a lock. The
+    file is only stat'ed when a lookup comes at least check_interval
+    seconds after the last check, and reloaded when its mtime changed.
+    """
+
+    def __init__(
+            self: Self,
+            path: Optional[str] = 'param_oracle.json',
+            check_interval: float = control_params['oracle_check_interval']
+            ) -> None:
+        """Initialize the oracle and load the file.
+
+        Args:
+            self (Self): self
+            path (Optional[str]): oracle file, None for an oracle that is
+                only filled with index()
+            check_interval (float): min seconds between mtime checks
+        """
+
+        self.path: Optional[str] = path
+        self.check_interval: float = check_interval
+        self._by_name: dict[str, ParamSpec] = {}
+        self._by_id: dict[int, ParamSpec] = {}
+        self._mtime: float = 0
+        self._last_check: float = 0
+        self._load_lock: Lock = Lock()
+
+        if path != None:
+            self.load()
+
+    def load(self: Self) -> None:
+        """Reload the oracle file.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        with self._load_lock:
+            mtime: float = os.stat(self.path).st_mtime
+            with open(self.path, 'r') as fp:
+                self.index(json.load(fp))
+            self._mtime = mtime
+            self._last_check = monotonic()
+
+    def index(self: Self, params: dict) -> None:
+        """Replace the indexes with the given parameters.
+
+        Args:
+            self (Self): self
+            params (dict): parameter name to id and type
+
+        Returns:
+            None:
+        """
+
+        by_name: dict[str, ParamSpec] = {}
+        by_id: dict[int, ParamSpec] = {}
+        for name, param in params.items():
+            spec: ParamSpec = (param['id'], name, param['type'])
+            by_name[name] = spec
+            by_id[param['id']] = spec
+
+        self._by_name, self._by_id = by_name, by_id
+
+    def lookup(self: Self, param: Union[int, str]) -> Optional[ParamSpec]:
+        """Get a parameter by id or by name.
+
+        Args:
+            self (Self): self
+            param (Union[int, str]): id or name of the parameter
+
+        Returns:
+            Optional[ParamSpec]: (id, name, type), None if unknown
+        """
+
+        if self.path != None and monotonic() - self._last_check >= self.check_interval:
+            self._check()
+
+        if type(param) == str:
+            return self._by_name.get(param)
+        return self._by_id.get(param)
+
+    def _check(self: Self) -> None:
+        """Reload the file if it changed, keeping the old index on errors."""
+
+        self._last_check = monotonic()
+        try:
+            if os.stat(self.path).st_mtime != self._mtime:
+                self.load()
+                log.info("Reloaded the parameter oracle")
+        except (OSError, ValueError, KeyError) as e:
+            log.error("Reloading the parameter oracle failed: %s", e)
+
+# process wide oracle
+oracle = ParamOracle()
@@ -1,49 +1,22 @@
 # recv_unpack.py
 
 #module import
-import socket
-import struct
-from sqlalchemy.orm import sessionmaker
-from utils import engine
-from models import HousePool, HDData
+import asyncio
+from db_writer import BatchWriter
+from house_registry import registry, RegistryRefresh
+from ingest_server import TelemetryProtocol, serve
+from log_pipeline import setup_logging
 
-#variables
-PORT = 42070
-ADDR = ""
+#log through the background writer
+setup_logging()
 
-#setup database session
-Session = sessionmaker(bind = engine)
-session = Session()
+#setup house registry
+registry.load()
+RegistryRefresh(registry).start()
 
-#setup socket udp server
-soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-soc.bind((ADDR, PORT))
+#setup batch writer
+writer = BatchWriter()
+writer.start()
 
 #listen for incoming messages
-while True:
-    byte_message = soc.recvfrom(1024)
-    data, house_addr = byte_message
-
-    #unpack message
-    device_state: int = data[0]
-    power_usage: float = struct.unpack(">f", data[1:5])[0]
-    temperature: float = struct.unpack(">f", data[5:9])[0]
-    unix_timestamp: int = int.from_bytes(data[9:13], 'big')
-
-    print(f"Received from {house_addr}: {device_state} {power_usage} {temperature} {unix_timestamp}")
-
-    #find correct house in database
-    house_id = session.query(HousePool).filter(
-            HousePool.ip == house_addr[0]
-            ).first().id
-
-    #create data entry
-    entry = HDData(device_state = device_state,
-                   power_usage = power_usage,
-                   temperature = temperature,
-                   timestamp = unix_timestamp,
-                   house_id = house_id)
-
-    #commit data
-    session.add(entry)
-    session.commit()
+asyncio.run(serve(TelemetryProtocol(writer)))
@@ -0,0 +1,331 @@
+# retention.py
+
+# imports
+import json
+import logging
+import re
+from datetime import datetime, timezone
+from threading import Thread
+from time import sleep, time
+from typing import Optional, Self
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from state_store import LatestStateStore, store
+from utils import engine
+
+# read config
+with open('retention_param.json', 'r') as fd:
+    retention_params: dict = json.load(fd)
+
+log = logging.getLogger(__name__)
+
+DAY: int = 86400
+
+# rollup table and bucket width in seconds
+ROLLUPS: tuple[tuple[str, int], ...] = (('hd_rollup_1m', 60), ('hd_rollup_1h', 3600))
+
+PARTITION_NAME = re.compile(r'^hd_data_(\d{8})$')
+
+# hd_data as a parent table range partitioned on timestamp,
+# the primary key has to contain the partition key
+PARTITIONED_HD_DATA: str = """
+CREATE TABLE hd_data (
+    id integer GENERATED BY DEFAULT AS IDENTITY,
+    device_state integer,
+    power_usage double precision,
+    temperature double precision,
+    timestamp integer,
+    house_id integer REFERENCES house_pool (id),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+def partition_name(day_start: int) -> str:
+    """Name of the daily partition starting at day_start.
+
+    Args:
+        day_start (int): unix time of the start of the day (UTC)
+
+    Returns:
+        str: partition name, hd_data_YYYYMMDD
+    """
+
+    return 'hd_data_' + datetime.fromtimestamp(day_start, timezone.utc).strftime('%Y%m%d')
+
+def partition_start(name: str) -> Optional[int]:
+    """Start of the day a partition covers.
+
+    Args:
+        name (str): partition name
+
+    Returns:
+        Optional[int]: unix time of the day start, None for other tables
+    """
+
+    match = PARTITION_NAME.match(name)
+    if match == None:
+        return None
+
+    day = datetime.strptime(match.group(1), '%Y%m%d').replace(tzinfo = timezone.utc)
+    return int(day.timestamp())
+
+def hd_data_kind(conn: Connection) -> Optional[str]:
+    """Get the pg_class relkind of hd_data.
+
+    Args:
+        conn (Connection): connection
+
+    Returns:
+        Optional[str]: 'p' partitioned, 'r' plain table, None if missing
+    """
+
+    return conn.execute(text(
+        "SELECT relkind FROM pg_class "
+        "WHERE relname = 'hd_data' AND pg_table_is_visible(oid)"
+        )).scalar()
+
+def list_partitions(conn: Connection) -> list[str]:
+    """Get the names of all hd_data partitions.
+
+    Args:
+        conn (Connection): connection
+
+    Returns:
+        list[str]: partition names
+    """
+
+    return list(conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = 'hd_data'"
+        )).scalars())
+
+def ensure_partitions(
+        conn: Connection,
+        now: int,
+        days_ahead: int = retention_params['partition_days_ahead'],
+        days_back: int = 0
+        ) -> None:
+    """Creates the daily partitions around now.
+
+    Rows of the new range that already landed in the default partition
+    are moved into the new partition before it is attached.
+
+    Args:
+        conn (Connection): connection, inside a transaction
+        now (int): current house time
+        days_ahead (int): days after today to create
+        days_back (int): days before today to create
+
+    Returns:
+        None:
+    """
+
+    existing: set[str] = set(list_partitions(conn))
+    today: int = now // DAY * DAY
+
+    for day in range(today - days_back * DAY, today + (days_ahead + 1) * DAY, DAY):
+        name: str = partition_name(day)
+        if name in existing:
+            continue
+
+        conn.execute(text(f"CREATE TABLE {name} (LIKE hd_data)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM hd_data_default "
+            f"WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+            ), {'start': day, 'end': day + DAY})
+        conn.execute(text(
+            f"ALTER TABLE hd_data ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ({day}) TO ({day + DAY})"
+            ))
+        log.info("Created partition %s", name)
+
+def setup_partitioning(
+        db_engine: Engine = engine,
+        raw_retention_days: int = retention_params['raw_retention_days']
+        ) -> None:
+    """Creates hd_data as a partitioned table, converting a plain one.
+
+    A plain hd_data is renamed, its rows are copied into the partitioned
+    table and it is dropped, all in one transaction. Daily partitions are
+    made for the retained days, older rows go to the default partition
+    until the retention job removes them.
+
+    Args:
+        db_engine (Engine): PostgreSQL engine
+        raw_retention_days (int): days of raw data to make partitions for
+
+    Returns:
+        None:
+    """
+
+    with db_engine.begin() as conn:
+        kind: Optional[str] = hd_data_kind(conn)
+        if kind == 'p':
+            return
+
+        if kind == 'r':
+            log.info("Converting hd_data to a partitioned table")
+            conn.execute(text("ALTER TABLE hd_data RENAME TO hd_data_legacy"))
+            conn.execute(text("ALTER INDEX hd_data_pkey RENAME TO hd_data_legacy_pkey"))
+            conn.execute(text("DROP INDEX IF EXISTS ix_hd_data_house_id_timestamp"))
+
+        conn.execute(text(PARTITIONED_HD_DATA))
+        conn.execute(text("CREATE TABLE hd_data_default PARTITION OF hd_data DEFAULT"))
+
+        now: int = int(time())
+        if kind == 'r':
+            now = conn.execute(text(
+                "SELECT coalesce(max(timestamp), :now) FROM hd_data_legacy"
+                ), {'now': now}).scalar()
+
+        ensure_partitions(conn, now, days_back = raw_retention_days)
+
+        if kind == 'r':
+            conn.execute(text(
+                "INSERT INTO hd_data (id, device_state, power_usage, temperature, timestamp, house_id) "
+                "SELECT id, device_state, power_usage, temperature, timestamp, house_id "
+                "FROM hd_data_legacy"
+                ))
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('hd_data', 'id'), "
+                "coalesce((SELECT max(id) FROM hd_data), 0) + 1, false)"
+                ))
+            conn.execute(text("DROP TABLE hd_data_legacy"))
+
+def rollup(conn: Connection, now: int, lateness: int = retention_params['rollup_lateness']) -> None:
+    """Aggregates raw samples into the 1 minute and 1 hour rollup tables.
+
+    Only complete buckets are written. The buckets that can still receive
+    late samples are recomputed on every run.
+
+    Args:
+        conn (Connection): connection, inside a transaction
+        now (int): current house time
+        lateness (int): seconds a sample may arrive late
+
+    Returns:
+        None:
+    """
+
+    for table, width in ROLLUPS:
+        last_end: Optional[int] = conn.execute(text(
+            f"SELECT max(bucket) + {width} FROM {table}"
+            )).scalar()
+
+        if last_end == None:
+            start: Optional[int] = conn.execute(text("SELECT min(timestamp) FROM hd_data")).scalar()
+            if start == None:
+                continue
+        else:
+            start = last_end - lateness
+        start = start // width * width
+        end: int = now // width * width
+
+        if start >= end:
+            continue
+
+        params: dict[str, int] = {'start': start, 'end': end, 'width': width}
+        conn.execute(text(
+            f"DELETE FROM {table} WHERE bucket >= :start AND bucket < :end"
+            ), params)
+        conn.execute(text(
+            f"INSERT INTO {table} (bucket, house_id, samples, "
+            f"min_power, max_power, mean_power, "
+            f"min_temperature, max_temperature, mean_temperature, device_state) "
+            f"SELECT timestamp / :width * :width, house_id, count(*), "
+            f"min(power_usage), max(power_usage), avg(power_usage), "
+            f"min(temperature), max(temperature), avg(temperature), "
+            f"mode() WITHIN GROUP (ORDER BY device_state) "
+            f"FROM hd_data WHERE timestamp >= :start AND timestamp < :end "
+            f"GROUP BY 1, 2"
+            ), params)
+
+def apply_retention(
+        conn: Connection,
+        now: int,
+        raw_retention_days: int = retention_params['raw_retention_days'],
+        minute_retention_days: int = retention_params['minute_retention_days']
+        ) -> None:
+    """Drops raw data and minute rollups past their retention.
+
+    Raw data is only removed once it is covered by the hourly rollup.
+
+    Args:
+        conn (Connection): connection, inside a transaction
+        now (int): current house time
+        raw_retention_days (int): days of raw data to keep
+        minute_retention_days (int): days of minute rollups to keep
+
+    Returns:
+        None:
+    """
+
+    rolled_up: Optional[int] = conn.execute(text(
+        "SELECT max(bucket) + 3600 FROM hd_rollup_1h"
+        )).scalar()
+    if rolled_up == None:
+        return
+
+    cutoff: int = min(now - raw_retention_days * DAY, rolled_up)
+
+    for name in list_partitions(conn):
+        start: Optional[int] = partition_start(name)
+        if start != None and start + DAY <= cutoff:
+            conn.execute(text(f"DROP TABLE {name}"))
+            log.info("Dropped partition %s", name)
+
+    conn.execute(text(
+        "DELETE FROM hd_data_default WHERE timestamp < :cutoff"
+        ), {'cutoff': cutoff})
+    conn.execute(text(
+        "DELETE FROM hd_rollup_1m WHERE bucket < :cutoff"
+        ), {'cutoff': now - minute_retention_days * DAY})
+
+class StorageMaintenance(Thread):
+    """Keeps partitions ahead of the house clocks, rolls up and applies retention.
+
+    The houses run on their own clock, so "now" is the newest timestamp in
+    the latest-state store, falling back to the wall clock.
+    """
+
+    def __init__(
+            self: Self,
+            interval: float = retention_params['maintenance_interval'],
+            db_engine: Engine = engine,
+            state_store: LatestStateStore = store
+            ) -> None:
+        super().__init__(daemon = True)
+        self.interval: float = interval
+        self._engine: Engine = db_engine
+        self._store: LatestStateStore = state_store
+
+    def run(self: Self) -> None:
+        while True:
+            try:
+                self.maintain()
+            except Exception as e:
+                log.exception("Storage maintenance failed: %s", e)
+            sleep(self.interval)
+
+    def maintain(self: Self) -> None:
+        """Run one maintenance pass.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        timestamps: list[int] = [sample[3] for sample in self._store.snapshot()]
+        now: int = max(timestamps) if timestamps else int(time())
+
+        with self._engine.begin() as conn:
+            ensure_partitions(conn, now)
+        with self._engine.begin() as conn:
+            rollup(conn, now)
+        with self._engine.begin() as conn:
+            apply_retention(conn, now)
@@ -0,0 +1,323 @@
+# rolling_stats.py
+
+# imports
+import json
+from threading import Lock
+from typing import Iterable, Optional, Self
+import numpy as np
+from telemetry import Sample
+
+# read config
+with open('anal_param.json', 'r') as fd:
+    params: dict = json.load(fd)
+
+# ewma, ewm_var, mean, var, min, max and rate of one value
+SeriesStats = dict[str, float]
+
+class SlotSeries():
+    """Rolling statistics of several values for a growing number of slots.
+
+    Every slot keeps the last window values in a ring with their running
+    sum and sum of squares, and an exponentially weighted mean and
+    variance. A new value is O(1): it replaces the oldest one in the ring
+    and adjusts the sums. The sums are recomputed from the ring every time
+    it wraps, so float errors do not pile up. Min and max are taken over
+    the ring when the statistics are read.
+    """
+
+    def __init__(self: Self, columns: int, window: int, alpha: float, slots: int = 64) -> None:
+        """Initialize the series.
+
+        Args:
+            self (Self): self
+            columns (int): values per sample
+            window (int): samples in the window
+            alpha (float): weight of a new sample in the ewma
+            slots (int): initial number of slots, grows as needed
+        """
+
+        self.columns: int = columns
+        self.window: int = window
+        self.alpha: float = alpha
+
+        self._ring: np.ndarray = np.zeros((slots, window, columns))
+        self._times: np.ndarray = np.zeros((slots, window))
+        self._sum: np.ndarray = np.zeros((slots, columns))
+        self._sumsq: np.ndarray = np.zeros((slots, columns))
+        self.ewma: np.ndarray = np.zeros((slots, columns))
+        self.ewm_var: np.ndarray = np.zeros((slots, columns))
+        self._pos: np.ndarray = np.zeros(slots, dtype = np.intp)
+        self._count: np.ndarray = np.zeros(slots, dtype = np.intp)
+
+    def grow(self: Self, slots: int) -> None:
+        """Make room for at least the given number of slots.
+
+        Args:
+            self (Self): self
+            slots (int): slots needed
+
+        Returns:
+            None:
+        """
+
+        current: int = len(self._pos)
+        if slots <= current:
+            return
+
+        size: int = max(slots, 2 * current)
+        for name in ('_ring', '_times', '_sum', '_sumsq', 'ewma', 'ewm_var', '_pos', '_count'):
+            old: np.ndarray = getattr(self, name)
+            new: np.ndarray = np.zeros((size,) + old.shape[1:], dtype = old.dtype)
+            new[:current] = old
+            setattr(self, name, new)
+
+    def push(self: Self, slot: int, time: float, values: tuple[float, ...]) -> None:
+        """Add a sample to a slot.
+
+        Args:
+            self (Self): self
+            slot (int): slot
+            time (float): time of the sample in seconds
+            values (tuple[float, ...]): one value per column
+
+        Returns:
+            None:
+        """
+
+        pos: int = int(self._pos[slot])
+        count: int = int(self._count[slot])
+        full: bool = count == self.window
+        ring: np.ndarray = self._ring
+        sums: np.ndarray = self._sum
+        sumsqs: np.ndarray = self._sumsq
+        ewma: np.ndarray = self.ewma
+        ewm_var: np.ndarray = self.ewm_var
+        alpha: float = self.alpha
+
+        # element by element, numpy calls on two values cost more than they save
+        for column, value in enumerate(values):
+            if full:
+                old: float = float(ring[slot, pos, column])
+                sums[slot, column] -= old
+                sumsqs[slot, column] -= old * old
+            sums[slot, column] += value
+            sumsqs[slot, column] += value * value
+            ring[slot, pos, column] = value
+
+            if count == 0:
+                ewma[slot, column] = value
+            else:
+                diff: float = value - float(ewma[slot, column])
+                increment: float = alpha * diff
+                ewma[slot, column] += increment
+                ewm_var[slot, column] = (1 - alpha) * (float(ewm_var[slot, column]) + diff * increment)
+
+        if not full:
+            self._count[slot] = count + 1
+        self._times[slot, pos] = time
+        pos = (pos + 1) % self.window
+        self._pos[slot] = pos
+
+        if pos == 0:
+            sums[slot] = ring[slot].sum(axis = 0)
+            sumsqs[slot] = np.square(ring[slot]).sum(axis = 0)
+
+    def stats(self: Self, slot: int) -> list[SeriesStats]:
+        """Get the statistics of a slot.
+
+        Args:
+            self (Self): self
+            slot (int): slot
+
+        Returns:
+            list[SeriesStats]: statistics per column, empty if the slot has no samples
+        """
+
+        count: int = int(self._count[slot])
+        if count == 0:
+            return []
+
+        pos: int = int(self._pos[slot])
+        newest: int = (pos - 1) % self.window
+        oldest: int = (pos - count) % self.window
+        ring: np.ndarray = self._ring[slot, :count] if count < self.window else self._ring[slot]
+        mean: np.ndarray = self._sum[slot] / count
+        var: np.ndarray = np.maximum(self._sumsq[slot] / count - mean * mean, 0)
+        elapsed: float = float(self._times[slot, newest] - self._times[slot, oldest])
+        if elapsed > 0:
+            rate: np.ndarray = (self._ring[slot, newest] - self._ring[slot, oldest]) / elapsed
+        else:
+            rate = np.zeros(self.columns)
+        low: np.ndarray = ring.min(axis = 0)
+        high: np.ndarray = ring.max(axis = 0)
+
+        return [{
+            'ewma': float(self.ewma[slot, column]),
+            'ewm_var': float(self.ewm_var[slot, column]),
+            'mean': float(mean[column]),
+            'var': float(var[column]),
+            'min': float(low[column]),
+            'max': float(high[column]),
+            'rate': float(rate[column])
+            } for column in range(self.columns)]
+
+class RollingStats():
+    """Rolling power and temperature statistics per house and of the area.
+
+    Fed from the ingest path next to the latest-state store, so smoothed
+    and trend values are available without reading hd_data. A house gets
+    a slot on its first sample. Like the store, samples older than the
+    latest one of their house are ignored. The area consumption is
+    recorded at most once per area_interval.
+    """
+
+    def __init__(
+            self: Self,
+            window: int = params['stats_window'],
+            alpha: float = params['stats_alpha'],
+            area_interval: float = params['stats_area_interval']
+            ) -> None:
+        """Initialize the statistics.
+
+        Args:
+            self (Self): self
+            window (int): samples in the window of every series
+            alpha (float): weight of a new sample in the ewma
+            area_interval (float): min seconds between area samples
+        """
+
+        self.houses: SlotSeries = SlotSeries(2, window, alpha)
+        self.total: SlotSeries = SlotSeries(1, window, alpha, slots = 1)
+        self.area_interval: float = area_interval
+        self._slots: dict[int, int] = {}
+        self._last_timestamp: dict[int, int] = {}
+        self._last_area: Optional[float] = None
+        self._lock: Lock = Lock()
+
+    def update(self: Self, sample: Sample) -> None:
+        """Add a house sample.
+
+        Args:
+            self (Self): self
+            sample (Sample): sample
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            self._update(sample)
+
+    def update_many(self: Self, samples: Iterable[Sample]) -> None:
+        """Add several house samples.
+
+        Args:
+            self (Self): self
+            samples (Iterable[Sample]): samples
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            for sample in samples:
+                self._update(sample)
+
+    def _update(self: Self, sample: Sample) -> None:
+        """Add a house sample, caller holds the lock.
+
+        Args:
+            self (Self): self
+            sample (Sample): sample
+
+        Returns:
+            None:
+        """
+
+        house_id: int = sample[4]
+        slot: Optional[int] = self._slots.get(house_id)
+        if slot == None:
+            slot = len(self._slots)
+            self.houses.grow(slot + 1)
+            self._slots[house_id] = slot
+        elif sample[3] < self._last_timestamp[house_id]:
+            return
+
+        self._last_timestamp[house_id] = sample[3]
+        self.houses.push(slot, sample[3], (sample[1], sample[2]))
+
+    def update_area(self: Self, consumption: float, now: float) -> None:
+        """Add the area consumption if area_interval passed since the last one.
+
+        Args:
+            self (Self): self
+            consumption (float): total consumption in kW
+            now (float): time in seconds
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            if self._last_area != None and now - self._last_area < self.area_interval:
+                return
+            self._last_area = now
+            self.total.push(0, now, (consumption,))
+
+    def house(self: Self, house_id: int) -> Optional[tuple[SeriesStats, SeriesStats]]:
+        """Get the statistics of a house.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+
+        Returns:
+            Optional[tuple[SeriesStats, SeriesStats]]: power and temperature
+                statistics, None if the house has not reported
+        """
+
+        with self._lock:
+            slot: Optional[int] = self._slots.get(house_id)
+            if slot == None:
+                return None
+            power, temperature = self.houses.stats(slot)
+        return power, temperature
+
+    def area(self: Self) -> Optional[SeriesStats]:
+        """Get the statistics of the area consumption.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            Optional[SeriesStats]: consumption statistics, None before the first sample
+        """
+
+        with self._lock:
+            stats: list[SeriesStats] = self.total.stats(0)
+        return stats[0] if stats else None
+
+    def smoothed(self: Self, samples: list[Sample]) -> list[Sample]:
+        """Replace the power of samples with the ewma of their house.
+
+        Args:
+            self (Self): self
+            samples (list[Sample]): samples
+
+        Returns:
+            list[Sample]: samples with smoothed power_usage
+        """
+
+        with self._lock:
+            slots: list[Optional[int]] = [self._slots.get(sample[4]) for sample in samples]
+            known: np.ndarray = np.array([slot != None for slot in slots], dtype = bool)
+            if not known.any():
+                return list(samples)
+            power: np.ndarray = np.array([sample[1] for sample in samples])
+            power[known] = self.houses.ewma[[slot for slot in slots if slot != None], 0]
+
+        return [(sample[0], float(value), sample[2], sample[3], sample[4])
+                for sample, value in zip(samples, power)]
+
+# process wide statistics
+rolling = RollingStats()
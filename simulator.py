@@ -0,0 +1,401 @@
+# simulator.py
+
+# imports
+import argparse
+import asyncio
+import json
+import random
+import resource
+from time import time
+from typing import Self
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from control_protocol import PacketView
+from initdb import migrate
+from models import HousePool
+from telemetry import RECORD
+from utils import engine
+
+# read config
+with open('ingest_param.json', 'r') as fd:
+    ingest_params: dict = json.load(fd)
+
+with open('control_param.json', 'r') as fd:
+    control_params: dict = json.load(fd)
+
+def house_address(index: int) -> str:
+    """Loopback address of a simulated house.
+
+    All of 127.0.0.0/8 is local on Linux, so every house gets its own
+    address and the controller sees it like a real subcontroller.
+
+    Args:
+        index (int): zero based house index
+
+    Returns:
+        str: ip, 127.1.0.1 upwards
+    """
+
+    block: int = index // 254
+    return f"127.{1 + block // 256}.{block % 256}.{index % 254 + 1}"
+
+async def read_packet(reader: asyncio.StreamReader) -> bytes:
+    """Read one control packet from a stream.
+
+    Packets are sent back to back on a kept connection without framing,
+    so the length follows from the flags and the fields.
+
+    Args:
+        reader (asyncio.StreamReader): control connection
+
+    Returns:
+        bytes: packet
+
+    Raises:
+        asyncio.IncompleteReadError: connection closed
+    """
+
+    packet: bytearray = bytearray(await reader.readexactly(1))
+    flags: int = packet[0]
+
+    if flags & 1:
+        packet += await reader.readexactly(4)
+    if flags & 2:
+        count: bytes = await reader.readexactly(1)
+        packet += count
+        for _ in range(count[0]):
+            header: bytes = await reader.readexactly(2)
+            packet += header
+            packet += await reader.readexactly(header[1])
+    if flags & 8:
+        packet += await reader.readexactly(1)
+    if flags & 16:
+        length: bytes = await reader.readexactly(2)
+        packet += length
+        packet += await reader.readexactly(int.from_bytes(length, 'big'))
+
+    return bytes(packet)
+
+class SimulatedHouse():
+    """Thermal and power model of one house with its own clock.
+
+    Device 1 is a heater: while it is on the house draws its rated power
+    and heats up, while it is off it only draws its standby power and
+    cools down towards the outdoor temperature.
+    """
+
+    def __init__(self: Self, house_id: int, ip: str, outdoor: float) -> None:
+        self.house_id: int = house_id
+        self.ip: str = ip
+        self.outdoor: float = outdoor
+
+        self.devices: int = 1
+        self.temperature: float = random.uniform(18, 23)
+        self.rated_power: float = random.uniform(1.0, 3.0)
+        self.standby_power: float = random.uniform(0.05, 0.2)
+        self.heat_gain: float = random.uniform(0.002, 0.004)
+        self.heat_loss: float = random.uniform(0.0001, 0.0003)
+
+        # house clock, off by up to a minute until the first clock sync
+        self.clock_offset: float = random.uniform(-60, 60)
+        self.last_step: float = time()
+
+        self.sent: int = 0
+        self.commands: int = 0
+
+    def step(self: Self, now: float) -> None:
+        """Advance the model to now.
+
+        Args:
+            self (Self): self
+            now (float): wall clock time
+
+        Returns:
+            None:
+        """
+
+        dt: float = now - self.last_step
+        self.last_step = now
+
+        heating: float = self.rated_power * self.heat_gain if self.devices & 1 else 0
+        self.temperature += dt * (heating - (self.temperature - self.outdoor) * self.heat_loss)
+
+    def power(self: Self) -> float:
+        if self.devices & 1:
+            return self.rated_power * random.uniform(0.95, 1.05)
+        return self.standby_power
+
+    def telemetry(self: Self, now: float) -> bytes:
+        """Make a telemetry datagram.
+
+        Args:
+            self (Self): self
+            now (float): wall clock time
+
+        Returns:
+            bytes: 13 byte record
+        """
+
+        self.step(now)
+        return RECORD.pack(self.devices, self.power(), self.temperature, int(now + self.clock_offset))
+
+    def apply(self: Self, view: PacketView) -> None:
+        """Apply a control packet.
+
+        Args:
+            self (Self): self
+            view (PacketView): packet
+
+        Returns:
+            None:
+        """
+
+        if not view.selects(self.house_id):
+            return
+
+        now: float = time()
+        self.step(now)
+        self.commands += 1
+
+        if view.clk != None:
+            self.clock_offset = view.clk - now
+
+        if view.devices != None:
+            if view.onoff:
+                self.devices |= view.devices
+            else:
+                self.devices &= ~view.devices
+
+class Fleet():
+    """Simulated houses sharing one event loop."""
+
+    def __init__(
+            self: Self,
+            houses: int,
+            rate: float,
+            controller: str,
+            autostart: bool,
+            outdoor: float,
+            house_ids: dict[str, int]
+            ) -> None:
+        # unregistered houses get id 0, which no group command selects
+        self.houses: list[SimulatedHouse] = [
+                SimulatedHouse(house_ids.get(house_address(index), 0), house_address(index), outdoor)
+                for index in range(houses)
+                ]
+        self.rate: float = rate
+        self.controller: tuple[str, int] = (controller, ingest_params['port'])
+        self.running: asyncio.Event = asyncio.Event()
+        if autostart:
+            self.running.set()
+
+        self.bad_packets: int = 0
+
+    async def run(self: Self) -> None:
+        loop = asyncio.get_running_loop()
+
+        # start/stop broadcast, one byte, 1 start and 0 stop
+        await loop.create_datagram_endpoint(
+                lambda: SignalProtocol(self),
+                local_addr = ('0.0.0.0', control_params['start_port']),
+                allow_broadcast = True
+                )
+
+        # group commands, broadcast to every house
+        await loop.create_datagram_endpoint(
+                lambda: GroupProtocol(self),
+                local_addr = ('0.0.0.0', control_params['group_port']),
+                allow_broadcast = True
+                )
+
+        tasks: list[asyncio.Task] = []
+        for house in self.houses:
+            await asyncio.start_server(
+                    lambda reader, writer, house = house: self.control(house, reader, writer),
+                    house.ip, control_params['port']
+                    )
+            transport, _ = await loop.create_datagram_endpoint(
+                    asyncio.DatagramProtocol,
+                    local_addr = (house.ip, 0),
+                    remote_addr = self.controller
+                    )
+            tasks.append(asyncio.create_task(self.stream(house, transport)))
+
+        state: str = 'streaming' if self.running.is_set() else 'waiting for the start broadcast'
+        print(f"Simulating {len(self.houses)} houses from {self.houses[0].ip}, {state}")
+        await self.report()
+
+    async def stream(self: Self, house: SimulatedHouse, transport: asyncio.DatagramTransport) -> None:
+        """Send telemetry at the configured rate, spread over the interval.
+
+        Args:
+            self (Self): self
+            house (SimulatedHouse): house
+            transport (asyncio.DatagramTransport): socket of the house
+
+        Returns:
+            None:
+        """
+
+        interval: float = 1 / self.rate
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            await self.running.wait()
+            transport.sendto(house.telemetry(time()))
+            house.sent += 1
+            await asyncio.sleep(interval)
+
+    async def control(
+            self: Self,
+            house: SimulatedHouse,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter
+            ) -> None:
+        """Apply the packets of one control connection until it closes.
+
+        Args:
+            self (Self): self
+            house (SimulatedHouse): house the connection belongs to
+            reader (asyncio.StreamReader): incoming packets
+            writer (asyncio.StreamWriter): connection
+
+        Returns:
+            None:
+        """
+
+        try:
+            while True:
+                packet: bytes = await read_packet(reader)
+                try:
+                    house.apply(PacketView(packet))
+                except ValueError as e:
+                    self.bad_packets += 1
+                    print(f"Bad packet for house {house.house_id}: {e}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def report(self: Self, interval: float = 10) -> None:
+        last_sent: int = 0
+        while True:
+            await asyncio.sleep(interval)
+            sent: int = sum(house.sent for house in self.houses)
+            on: int = sum(1 for house in self.houses if house.devices & 1)
+            load: float = sum(house.rated_power if house.devices & 1 else house.standby_power
+                              for house in self.houses)
+            commands: int = sum(house.commands for house in self.houses)
+            print(f"{(sent - last_sent) / interval:.0f} datagrams/s, {on}/{len(self.houses)} houses on, "
+                  f"{load:.1f} kW, {commands} commands, {self.bad_packets} bad packets")
+            last_sent = sent
+
+class SignalProtocol(asyncio.DatagramProtocol):
+    """Start/stop broadcast of start_protocol.onoff_houses."""
+
+    def __init__(self: Self, fleet: Fleet) -> None:
+        self.fleet: Fleet = fleet
+
+    def datagram_received(self: Self, data: bytes, addr: tuple[str, int]) -> None:
+        if data == b'\x01':
+            self.fleet.running.set()
+            print("Start signal, streaming telemetry")
+        elif data == b'\x00':
+            self.fleet.running.clear()
+            print("Stop signal, telemetry paused")
+
+class GroupProtocol(asyncio.DatagramProtocol):
+    """Group commands, applied to every selected house."""
+
+    def __init__(self: Self, fleet: Fleet) -> None:
+        self.fleet: Fleet = fleet
+
+    def datagram_received(self: Self, data: bytes, addr: tuple[str, int]) -> None:
+        try:
+            view: PacketView = PacketView(data)
+        except ValueError as e:
+            self.fleet.bad_packets += 1
+            print(f"Bad group packet: {e}")
+            return
+
+        # houses that are not selected ignore the packet
+        for house in self.fleet.houses:
+            house.apply(view)
+
+def registered_ids(houses: int, add: bool = False) -> dict[str, int]:
+    """Looks up the simulated houses in house_pool by their ip.
+
+    With add the missing ones are inserted and the database assigns their
+    ids, so the ids of houses that are already there, like the ones of
+    initdb.py, are left alone and the id sequence stays in step.
+
+    Args:
+        houses (int): number of houses
+        add (bool): insert the houses that are not in house_pool
+
+    Returns:
+        dict[str, int]: house_id per ip, only for registered houses
+    """
+
+    addresses: list[str] = [house_address(index) for index in range(houses)]
+
+    migrate(engine)
+    with Session(engine) as session:
+        ids: dict[str, int] = dict(session.execute(select(HousePool.ip, HousePool.id)).tuples().all())
+        missing: list[HousePool] = [
+                HousePool(name = f"Sim house {index + 1}", ip = ip)
+                for index, ip in enumerate(addresses) if ip not in ids
+                ]
+        if add and missing:
+            session.add_all(missing)
+            session.commit()
+            ids.update((house.ip, house.id) for house in missing)
+            print(f"Registered {len(missing)} simulated houses")
+
+    ids = {ip: ids[ip] for ip in addresses if ip in ids}
+    if len(ids) < houses:
+        print(f"{houses - len(ids)} simulated houses are not in house_pool, "
+              f"the controller ignores them, see --register")
+    return ids
+
+def raise_file_limit(houses: int) -> None:
+    """Raise the open file limit, every house needs two sockets."""
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed: int = 2 * houses + 64
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+        if hard < needed:
+            print(f"Open file limit {hard} is too low for {houses} houses")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description = "Simulated house fleet on loopback addresses",
+            epilog = "The houses listen for the start/stop and group datagrams on every "
+                     "local address. For a controller on this machine set start_address and "
+                     "group_address in control_param.json to 127.255.255.255, the defaults "
+                     "broadcast to the 10.10.0.0/24 house network and never reach the simulator."
+            )
+    parser.add_argument('--houses', type = int, default = 100)
+    parser.add_argument('--rate', type = float, default = 1.0,
+                        help = "telemetry datagrams per second per house")
+    parser.add_argument('--controller', default = '127.0.0.1',
+                        help = "address of the area controller's ingest server")
+    parser.add_argument('--autostart', action = 'store_true',
+                        help = "stream telemetry without waiting for the start broadcast")
+    parser.add_argument('--outdoor', type = float, default = 5.0,
+                        help = "outdoor temperature")
+    parser.add_argument('--register', action = 'store_true',
+                        help = "add the simulated houses missing from house_pool, matched by ip")
+    parser.add_argument('--seed', type = int)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    raise_file_limit(args.houses)
+
+    house_ids: dict[str, int] = registered_ids(args.houses, args.register)
+
+    fleet = Fleet(args.houses, args.rate, args.controller, args.autostart, args.outdoor, house_ids)
+    try:
+        asyncio.run(fleet.run())
+    except KeyboardInterrupt:
+        pass
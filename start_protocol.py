@@ -1,16 +1,22 @@
 # start_protocol.py
 
 # imports
+import json
 import socket
 
+# read config
+with open('control_param.json', 'r') as fd:
+    control_params: dict = json.load(fd)
+
 def onoff_houses(on_off = False) -> None:
 
     start_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     start_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     start_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    address = (control_params['start_address'], control_params['start_port'])
     if on_off:
-        start_sock.sendto(b'\x01', ('10.10.0.255', 6969))
+        start_sock.sendto(b'\x01', address)
         start_sock.close()
     elif not on_off:
-        start_sock.sendto(b'\x00', ('10.10.0.255', 6969))
+        start_sock.sendto(b'\x00', address)
         start_sock.close()
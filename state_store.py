@@ -0,0 +1,249 @@
+# state_store.py
+
+# imports
+import json
+from threading import Event, Lock
+from time import sleep
+from typing import Iterable, Optional, Self
+from sqlalchemy import Select, select, true
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import aliased
+from models import HDData, HousePool
+from telemetry import Sample
+from utils import engine
+
+# read config
+with open('anal_param.json', 'r') as fd:
+    params: dict = json.load(fd)
+
+def latest_query(dialect: str) -> Select:
+    """Builds one query for the latest sample of every house.
+
+    On PostgreSQL a LATERAL join probes the (house_id, timestamp DESC)
+    index once per house, so the latency follows the number of houses and
+    not the size of hd_data. Other databases, which lack LATERAL, probe
+    the same index from a correlated subquery.
+
+    Args:
+        dialect (str): name of the database dialect
+
+    Returns:
+        Select: query returning (device_state, power_usage, temperature,
+            timestamp, house_id) rows
+    """
+
+    if dialect == 'postgresql':
+        latest = select(
+                HDData.device_state,
+                HDData.power_usage,
+                HDData.temperature,
+                HDData.timestamp
+                ).where(
+                        HDData.house_id == HousePool.id
+                        ).order_by(
+                                HDData.timestamp.desc()
+                                ).limit(1).lateral()
+
+        return select(
+                latest.c.device_state,
+                latest.c.power_usage,
+                latest.c.temperature,
+                latest.c.timestamp,
+                HousePool.id
+                ).join(latest, true())
+
+    # correlated subquery picking the id of the newest row per house
+    inner = aliased(HDData)
+    newest = select(inner.id).where(
+            inner.house_id == HousePool.id
+            ).order_by(
+                    inner.timestamp.desc()
+                    ).limit(1).correlate(HousePool).scalar_subquery()
+
+    return select(
+            HDData.device_state,
+            HDData.power_usage,
+            HDData.temperature,
+            HDData.timestamp,
+            HDData.house_id
+            ).select_from(HousePool).join(HDData, HDData.id == newest)
+
+class LatestStateStore():
+    """Thread safe store of the latest sample per house.
+
+    The ingest path updates it as samples arrive, so the control loop can
+    read the fleet state without querying hd_data. Like the old
+    ORDER BY timestamp DESC lookups, the sample with the highest timestamp
+    wins, so reordered or late samples never replace newer ones.
+
+    The store also keeps the aggregate consumption of the area and signals
+    waiting threads when it moved by at least change_threshold.
+    """
+
+    def __init__(self: Self, change_threshold: float = params['change_threshold']) -> None:
+        """Initialize the store.
+
+        Args:
+            self (Self): self
+            change_threshold (float): aggregate change in kW that wakes
+                up wait_for_change
+        """
+
+        self._latest: dict[int, Sample] = {}
+        self._lock: Lock = Lock()
+
+        self.change_threshold: float = change_threshold
+        self._total: float = 0
+        self._signalled_total: float = 0
+        self._changed: Event = Event()
+
+    def __len__(self: Self) -> int:
+        return len(self._latest)
+
+    def update(self: Self, sample: Sample) -> None:
+        """Store a sample if it is the newest of its house.
+
+        Args:
+            self (Self): self
+            sample (Sample): sample
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            self._store(sample)
+            self._signal()
+
+    def update_many(self: Self, samples: Iterable[Sample]) -> None:
+        """Store several samples, keeping the newest per house.
+
+        Args:
+            self (Self): self
+            samples (Iterable[Sample]): samples
+
+        Returns:
+            None:
+        """
+
+        with self._lock:
+            for sample in samples:
+                self._store(sample)
+            self._signal()
+
+    def _store(self: Self, sample: Sample) -> None:
+        """Store a sample if it is the newest, caller holds the lock.
+
+        Args:
+            self (Self): self
+            sample (Sample): sample
+
+        Returns:
+            None:
+        """
+
+        current: Optional[Sample] = self._latest.get(sample[4])
+        if current == None:
+            self._latest[sample[4]] = sample
+            self._total += sample[1]
+        elif sample[3] >= current[3]:
+            self._latest[sample[4]] = sample
+            self._total += sample[1] - current[1]
+
+    def _signal(self: Self) -> None:
+        """Wake up waiters if the aggregate moved enough, caller holds the lock.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            None:
+        """
+
+        if abs(self._total - self._signalled_total) >= self.change_threshold:
+            self._signalled_total = self._total
+            self._changed.set()
+
+    def total_consumption(self: Self) -> float:
+        """Get the aggregate consumption of all houses.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            float: sum of the latest power_usage per house
+        """
+
+        return self._total
+
+    def wait_for_change(self: Self, timeout: Optional[float], debounce: float = 0) -> bool:
+        """Wait until the aggregate consumption changed.
+
+        After a change the waiter sleeps debounce seconds,
+        so a burst of samples results in one wake up.
+
+        Args:
+            self (Self): self
+            timeout (Optional[float]): max seconds to wait, None waits forever
+            debounce (float): seconds to let further changes settle
+
+        Returns:
+            bool: True if the aggregate changed, False on timeout
+        """
+
+        if not self._changed.wait(timeout):
+            return False
+
+        if debounce > 0:
+            sleep(debounce)
+        self._changed.clear()
+        return True
+
+    def get(self: Self, house_id: int) -> Optional[Sample]:
+        """Get the latest sample of a house.
+
+        Args:
+            self (Self): self
+            house_id (int): house_id
+
+        Returns:
+            Optional[Sample]: sample or None if the house has not reported
+        """
+
+        return self._latest.get(house_id)
+
+    def snapshot(self: Self) -> list[Sample]:
+        """Get the latest sample of every house that has reported.
+
+        Args:
+            self (Self): self
+
+        Returns:
+            list[Sample]: samples ordered by house_id
+        """
+
+        with self._lock:
+            samples: list[Sample] = list(self._latest.values())
+        samples.sort(key = lambda sample: sample[4])
+        return samples
+
+    def warm(self: Self, db_engine: Engine = engine) -> None:
+        """Load the latest sample per house from hd_data.
+
+        Args:
+            self (Self): self
+            db_engine (Engine): Engine to read from
+
+        Returns:
+            None:
+        """
+
+        query = latest_query(db_engine.dialect.name)
+
+        with db_engine.connect() as conn:
+            rows = conn.execute(query).all()
+
+        self.update_many(tuple(row) for row in rows)
+
+# process wide store
+store = LatestStateStore()
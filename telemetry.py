@@ -0,0 +1,57 @@
+# telemetry.py
+
+# imports
+import struct
+from typing import Optional
+
+# Layout of one telemetry record:
+# device_state (1), power_usage (4), temperature (4), unix_timestamp (4)
+RECORD: struct.Struct = struct.Struct(">BffI")
+RECORD_SIZE: int = RECORD.size
+
+# (device_state, power_usage, temperature, timestamp)
+Record = tuple[int, float, float, int]
+
+# (device_state, power_usage, temperature, timestamp, house_id)
+Sample = tuple[int, float, float, int, int]
+
+def decode_telemetry(data: bytes) -> Optional[Record]:
+    """Decodes one telemetry datagram.
+
+    Args:
+        data (bytes): datagram payload
+
+    Returns:
+        Optional[Record]: decoded record or None if the datagram is malformed
+    """
+
+    if len(data) != RECORD_SIZE:
+        return None
+
+    return RECORD.unpack(data)
+
+def decode_batch(
+        datagrams: list[tuple[bytes, tuple[str, int]]]
+        ) -> tuple[list[tuple[Record, tuple[str, int]]], int]:
+    """Decodes a drained batch of telemetry datagrams at once.
+
+    The valid datagrams are joined into one buffer and unpacked with a
+    single iter_unpack pass, datagrams of the wrong size are rejected.
+
+    Args:
+        datagrams (list[tuple[bytes, tuple[str, int]]]): (payload, sender) pairs
+
+    Returns:
+        tuple[list[tuple[Record, tuple[str, int]]], int]: decoded
+            (record, sender) pairs and the number of rejected datagrams
+    """
+
+    payloads: list[bytes] = []
+    senders: list[tuple[str, int]] = []
+    for data, addr in datagrams:
+        if len(data) == RECORD_SIZE:
+            payloads.append(data)
+            senders.append(addr)
+
+    records = RECORD.iter_unpack(b''.join(payloads))
+    return list(zip(records, senders)), len(datagrams) - len(payloads)
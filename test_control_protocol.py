@@ -0,0 +1,136 @@
+# test_control_protocol.py
+
+# imports
+import random
+import pytest
+from control_protocol import ControlPacket, PacketBuilder, PacketView
+from param_oracle import ParamOracle
+
+def make_oracle() -> ParamOracle:
+    """Oracle with int, float and bool parameters for ids 1 to 255.
+
+    Returns:
+        ParamOracle: oracle that is not backed by a file
+    """
+
+    oracle = ParamOracle(None)
+    oracle.index({
+        f"param{i}": {'id': i, 'type': ('int', 'float', 'bool')[i % 3]}
+        for i in range(1, 256)
+        })
+    return oracle
+
+def random_packet(oracle: ParamOracle, params: int) -> tuple[bytes, dict]:
+    """Builds a random control packet.
+
+    Args:
+        oracle (ParamOracle): oracle from make_oracle
+        params (int): number of parameters
+
+    Returns:
+        tuple[bytes, dict]: packet and the fields that went into it
+    """
+
+    fields: dict = {'clk': None, 'params': {}, 'devices': None, 'selector': None}
+    builder = PacketBuilder(oracle)
+
+    if random.random() < 0.5:
+        fields['clk'] = random.randint(0, 2 ** 32 - 1)
+        builder.add_clksync(fields['clk'])
+
+    for param_id in random.sample(range(1, 256), params):
+        ptype: str = oracle.lookup(param_id)[2]
+        if ptype == 'float':
+            value = random.uniform(-1e6, 1e6)
+        elif ptype == 'bool':
+            value = random.random() < 0.5
+        else:
+            value = random.randint(0, 2 ** random.randint(0, 64))
+        builder.add_parameter(param_id, value)
+        fields['params'][param_id] = value
+
+    if random.random() < 0.5:
+        fields['devices'] = (random.random() < 0.5, random.randint(0, 255))
+        builder.add_devices(*fields['devices'])
+
+    if random.random() < 0.3:
+        fields['selector'] = set(random.sample(range(0, 2048), random.randint(0, 64)))
+        builder.add_selector(fields['selector'])
+
+    return builder.build(), fields
+
+def assert_prefixes_rejected(data: bytes) -> None:
+    """Every proper prefix of a packet must be rejected as too short."""
+
+    for end in range(len(data)):
+        with pytest.raises(ValueError):
+            PacketView(data[:end])
+
+@pytest.mark.parametrize('params', [0, 1, 2, 8, 64, 255])
+def test_random_packets_round_trip(params: int) -> None:
+    random.seed(params)
+    oracle: ParamOracle = make_oracle()
+
+    for _ in range(100):
+        data, fields = random_packet(oracle, params)
+        view = PacketView(data)
+
+        assert view.clk == fields['clk']
+        assert [param_id for param_id, _ in view.params()] == sorted(fields['params'])
+        for param_id, value in fields['params'].items():
+            assert view.value(param_id, oracle) == value
+        if fields['devices'] == None:
+            assert view.devices == None
+        else:
+            assert (view.onoff, view.devices) == fields['devices']
+        if fields['selector'] == None:
+            assert view.selector == None
+        else:
+            assert {h for h in range(2048) if view.selects(h)} == fields['selector']
+
+        assert ControlPacket.from_bytes(data).get_packet() == data
+        assert_prefixes_rejected(data)
+
+@pytest.mark.parametrize('clk, devices', [(None, (True, 1)), (None, (False, 3)), (1682092177, None), (7, (True, 255))])
+def test_clock_and_device_packets(clk, devices) -> None:
+    builder = PacketBuilder(make_oracle())
+    if clk != None:
+        builder.add_clksync(clk)
+    if devices != None:
+        builder.add_devices(*devices)
+    data: bytes = builder.build()
+
+    view = PacketView(data)
+    assert view.clk == clk
+    assert len(view) == 0 and list(view.params()) == []
+    assert view.selects(12345)
+    if devices == None:
+        assert view.devices == None and view.onoff == None
+    else:
+        assert (view.onoff, view.devices) == devices
+
+    assert ControlPacket.from_bytes(data).get_packet() == data
+    assert_prefixes_rejected(data)
+    with pytest.raises(ValueError):
+        PacketView(data + b'\x00')
+
+def test_trailing_bytes_rejected() -> None:
+    random.seed(1)
+    data, _ = random_packet(make_oracle(), 8)
+    with pytest.raises(ValueError):
+        PacketView(data + b'\x00')
+
+def test_invalid_flags_rejected() -> None:
+    with pytest.raises(ValueError):
+        PacketView(b'\x20')
+    # device state without devices
+    with pytest.raises(ValueError):
+        PacketView(b'\x04')
+
+def test_parameters_out_of_order_rejected() -> None:
+    # two parameters, id 5 before id 3
+    with pytest.raises(ValueError):
+        PacketView(bytes([2, 2, 5, 1, 0, 3, 1, 0]))
+    # the same id twice
+    with pytest.raises(ValueError):
+        PacketView(bytes([2, 2, 5, 1, 0, 5, 1, 0]))
@@ -0,0 +1,45 @@
+# test_decision.py
+
+# imports
+from decision import HouseData, decide
+from house_state import HouseStateRegistry
+
+def make_states(house_data: list[HouseData]) -> HouseStateRegistry:
+    """Registry with the on/off state and temperatures of the data.
+
+    Args:
+        house_data (list[HouseData]): latest data per house
+
+    Returns:
+        HouseStateRegistry: registry that is not restored from a database
+    """
+
+    states = HouseStateRegistry()
+    for data in house_data:
+        if not data[0] & 1:
+            states.set_state(data[4], False)
+    states.observe(house_data)
+    return states
+
+def test_idle_houses_are_not_switched_off() -> None:
+    # three hot idle houses, two colder ones at 3 kW
+    house_data: list[HouseData] = [
+        (1, 0.0, 30.0, 1, 1),
+        (1, 0.0, 29.0, 1, 2),
+        (1, 0.0, 28.0, 1, 3),
+        (1, 3.0, 25.0, 1, 4),
+        (1, 3.0, 24.0, 1, 5)
+        ]
+
+    assert decide(house_data, make_states(house_data), 4, 5, 1.5) == ([4], [])
+
+def test_switch_off_hottest_until_below_max() -> None:
+    house_data: list[HouseData] = [(1, 2.0, 30.0 - house_id, 1, house_id) for house_id in range(1, 6)]
+
+    assert decide(house_data, make_states(house_data), 4, 7, 1.5) == ([1, 2], [])
+
+def test_switch_on_coldest_without_going_over_max() -> None:
+    house_data: list[HouseData] = [(1, 2.0, 22.0, 1, 1)] + \
+        [(0, 0.0, 15.0 + house_id, 1, house_id) for house_id in range(2, 6)]
+
+    assert decide(house_data, make_states(house_data), 5, 7, 1.5) == ([], [2, 3])
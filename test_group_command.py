@@ -0,0 +1,81 @@
+# test_group_command.py
+
+# imports
+from typing import Optional
+from group_command import dispatch
+
+class FakeChannel():
+    """Group channel that records the datagrams instead of sending them."""
+
+    def __init__(self) -> None:
+        self.sent: list[bytes] = []
+
+    def send(self, payload: bytes) -> bool:
+        self.sent.append(payload)
+        return True
+
+class FakeRegistry():
+    """Every house has the ip 10.0.0.<house_id>."""
+
+    def ip_of(self, house_id: int) -> Optional[str]:
+        return f"10.0.0.{house_id}"
+
+class FakePool():
+    """Connection pool that delivers every packet in time."""
+
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+
+    def send_many(self, payloads: dict[str, bytes], deadline: float, on_late = None) -> dict:
+        self.sent.extend(payloads)
+        return {ip: (True, 0.0) for ip in payloads}
+
+class FakeStore():
+    """Latest sample per house, the houses report the switched off state
+    once the command was sent."""
+
+    def __init__(self, samples: dict[int, tuple], reports: bool) -> None:
+        self.samples: dict[int, tuple] = samples
+        self.reports: bool = reports
+        self.reads: int = 0
+
+    def get(self, house_id: int) -> Optional[tuple]:
+        self.reads += 1
+        sample = self.samples.get(house_id)
+        if self.reports and sample != None and self.reads > len(self.samples):
+            return (0, 0.0, sample[2], sample[3] + 1, house_id)
+        return sample
+
+def run_dispatch(state_store: FakeStore) -> tuple[FakeChannel, FakePool, tuple[list[int], list[int]]]:
+    channel = FakeChannel()
+    connection_pool = FakePool()
+    result = dispatch(
+            [1, 2],
+            [],
+            channel = channel,
+            house_registry = FakeRegistry(),
+            connection_pool = connection_pool,
+            state_store = state_store,
+            group_min_houses = 2,
+            group_acks = True,
+            ack_timeout = 0.05,
+            deadline = 1.0
+            )
+    return channel, connection_pool, result
+
+def test_samples_from_before_the_command_do_not_acknowledge() -> None:
+    # the houses already show the switched off state, but nothing newer arrives
+    state_store = FakeStore({1: (0, 0.0, 20.0, 5, 1), 2: (0, 0.0, 20.0, 7, 2)}, reports = False)
+    channel, connection_pool, result = run_dispatch(state_store)
+
+    assert len(channel.sent) == 1
+    assert sorted(connection_pool.sent) == ['10.0.0.1', '10.0.0.2']
+    assert sorted(result[0]) == [1, 2]
+
+def test_newer_samples_acknowledge() -> None:
+    state_store = FakeStore({1: (1, 2.0, 20.0, 5, 1), 2: (1, 2.0, 20.0, 7, 2)}, reports = True)
+    channel, connection_pool, result = run_dispatch(state_store)
+
+    assert len(channel.sent) == 1
+    assert connection_pool.sent == []
+    assert sorted(result[0]) == [1, 2]